@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'main',
     'rest_framework',
     'simple_email_confirmation',
@@ -124,17 +125,52 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'main.authentication.CachedJSONWebTokenAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'main.pagination.IdCursorPagination',
+    'PAGE_SIZE': config('API_PAGE_SIZE', default=50, cast=int),
 }
 
+# Upper bound for the page_size query parameter
+
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=200, cast=int)
+
+# Nearby coupons search: radius in metres and how many nearest outlets are considered
+
+NEARBY_DEFAULT_RADIUS = 5000
+NEARBY_MAX_RADIUS = 50000
+NEARBY_MAX_OUTLETS = 1000
+
 # JWT Auth configs
 
 JWT_AUTH = {
     'JWT_ALLOW_REFRESH': True,
     'JWT_EXPIRATION_DELTA': datetime.timedelta(hours=1),
+    'JWT_PAYLOAD_HANDLER': 'main.authentication.jwt_payload_handler',
+}
+
+# Caches
+# Authenticated users are kept per process for a short time, see main.authentication
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'users': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'users',
+        'TIMEOUT': config('USER_CACHE_TTL', default=30, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
 }
 
+# Categories, types and interests are cached per process, so this bounds how long
+# another worker may serve them after an admin change
+
+REFERENCE_CACHE_TTL = config('REFERENCE_CACHE_TTL', default=60, cast=int)
+
 # Custom Auth
 
 AUTHENTICATION_BACKENDS = [
@@ -146,6 +182,104 @@ AUTHENTICATION_BACKENDS = [
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = '/tmp/email/'
 
+# Email outbox, delivered by `manage.py send_emails`
+
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+# Seconds before the first retry, doubled on every next one
+EMAIL_OUTBOX_RETRY_DELAY = 30
+# Seconds a worker holds the emails it claimed, others retry them if it dies while sending
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 300
+EMAIL_OUTBOX_POLL_INTERVAL = 2
+
+# Campaign statistics, rolled up by `manage.py rollup_stats`
+
+STATS_ROLLUP_BATCH_SIZE = 10000
+STATS_ROLLUP_INTERVAL = 5
+# Max number of buckets returned by /api/campaigns/{id}/stats
+STATS_MAX_BUCKETS = 1500
+
+# Per-redemption coupon codes
+
+CODE_POOL_BATCH_SIZE = 10000
+# Max codes generated by a single API call, use `manage.py generate_codes` for more
+CODE_POOL_MAX_REQUEST = 100000
+
+# Coupon and campaign `live` flags, kept up to date by `manage.py sweep_lifecycle`
+
+LIFECYCLE_SWEEP_BATCH_SIZE = 10000
+# Seconds to wait when nothing is due, also the delay before a coupon goes live or expires
+LIFECYCLE_SWEEP_INTERVAL = 10
+
+# Text search configuration of the coupon search vectors
+
+SEARCH_CONFIG = 'english'
+
+# Consumer feed ranking: per shared interest, per star of the average rating,
+# and for recency, which halves after a day and keeps decaying
+
+FEED_INTEREST_WEIGHT = 1.0
+FEED_RATING_WEIGHT = 0.2
+FEED_RECENCY_WEIGHT = 1.0
+# Candidates kept per consumer, the feed is never longer
+FEED_SIZE = 500
+# Seconds after which a consumer's candidates are rebuilt with current ratings and recency
+FEED_REFRESH_AGE = 3600
+# Coupons and consumers per batch of `manage.py refresh_feeds`
+FEED_REFRESH_BATCH_SIZE = 100
+# Seconds `manage.py refresh_feeds` sleeps when nothing is due
+FEED_REFRESH_INTERVAL = 5
+
+# Outlet imports, /api/outlets/import and `manage.py import_outlets`
+
+# Rows validated and inserted per statement
+OUTLET_IMPORT_CHUNK_SIZE = 1000
+# Failed rows reported in detail, the rest are only counted
+OUTLET_IMPORT_MAX_ERRORS = 100
+
+# Coupon image uploads, checked while they are streamed to disk
+
+COUPON_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+# Max width and height in pixels
+COUPON_IMAGE_MAX_DIMENSION = 8000
+
+# Max coupons created or changed by one /api/coupons/bulk request
+COUPON_BULK_MAX_ITEMS = 1000
+
+# Coupon image variants, rendered by `manage.py render_images`
+
+# Size name -> max width and height in pixels
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'small': 480,
+    'medium': 1024,
+}
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_RENDER_BATCH_SIZE = 20
+IMAGE_RENDER_INTERVAL = 2
+
+# Unreferenced coupon images, deleted by `manage.py collect_blobs`
+
+# Seconds a file has to be old before it is deleted, longer than any upload takes to commit
+BLOB_GC_GRACE = 3600
+BLOB_GC_INTERVAL = 86400
+
+# Hot offer emails, queued by `manage.py fan_out_alerts`
+
+ALERT_FANOUT_BATCH_SIZE = 100
+# Seconds a live coupon has to be unchanged before its alerts go out
+ALERT_FANOUT_DELAY = 5
+ALERT_FANOUT_INTERVAL = 5
+
+# Coupon delta sync, /api/sync/coupons
+
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 5000
+# Seconds between runs of `manage.py compact_changes`
+SYNC_COMPACT_INTERVAL = 3600
+# Ids of the change log compacted per statement
+SYNC_COMPACT_BATCH_SIZE = 10000
+
 # Site url for email
 
 SITE_URL = "http://localhost:8000"
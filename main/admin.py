@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from main.models import Vendor, Consumer, Organization, Outlet, Campaign, Coupon, Category, Type, Interest, User
+from main.models import Vendor, Consumer, Organization, Outlet, Campaign, Coupon, Category, Type, Interest, User, \
+    Email
 
 
 @admin.register(User)
@@ -68,3 +69,10 @@ class TypeAdmin(admin.ModelAdmin):
 class InterestAdmin(admin.ModelAdmin):
     fields = ['name', 'description']
     list_display = ['name', 'description']
+
+
+@admin.register(Email)
+class EmailAdmin(admin.ModelAdmin):
+    fields = ['subject', 'to', 'template', 'context', 'next_attempt', 'attempts', 'last_error']
+    list_display = ['id', 'subject', 'to', 'created', 'attempts', 'next_attempt']
+    search_fields = ['to']
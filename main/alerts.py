@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+PENDING_SQL = """
+UPDATE main_coupon SET alerted = true
+WHERE id IN (SELECT id FROM main_coupon WHERE live AND NOT alerted AND updated_at < %s
+             ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED)
+RETURNING id
+"""
+
+# One outbox email per consumer sharing interests with a coupon.
+# Consumers with a location only hear about coupons with an outlet within their radius.
+ALERTS_SQL = """
+INSERT INTO main_email (subject, "to", template, context, created, next_attempt, attempts)
+SELECT %(subject)s, u.email, %(template)s,
+       jsonb_build_object('username', u.username, 'coupon', c.name, 'deal', c.deal, 'organization', o.name,
+                          'site_url', %(site_url)s),
+       now(), now(), 0
+FROM (SELECT DISTINCT ci.consumer_id, ki.coupon_id
+      FROM main_coupon_interests ki JOIN main_consumer_interests ci ON ci.interest_id = ki.interest_id
+      WHERE ki.coupon_id = ANY(%(coupons)s)) f
+JOIN main_consumer p ON p.id = f.consumer_id
+JOIN main_user u ON u.id = p.user_id
+JOIN main_coupon c ON c.id = f.coupon_id
+JOIN main_campaign ca ON ca.id = c.campaign_id
+JOIN main_organization o ON o.id = ca.organization_id
+WHERE p.alerts
+  AND (p.alert_radius IS NULL OR p.latitude IS NULL OR p.longitude IS NULL OR EXISTS (
+      SELECT 1 FROM main_coupon_outlets co JOIN main_outlet ol ON ol.id = co.outlet_id
+      WHERE co.coupon_id = c.id AND ST_DWithin(
+          ol.geom::geography, ST_SetSRID(ST_MakePoint(p.longitude, p.latitude), 4326)::geography, p.alert_radius)))
+"""
+
+
+def fan_out_alerts(batch_size: int = None) -> int:
+    """
+    Queues hot offer emails for at most `batch_size` coupons that went live since the last run, with
+    a single INSERT ... SELECT over the consumers sharing their interests. Coupons must be unchanged for
+    ALERT_FANOUT_DELAY seconds, so interests and outlets saved right after the coupon are matched too.
+    Returns the number of coupons processed.
+    """
+    batch_size = batch_size or settings.ALERT_FANOUT_BATCH_SIZE
+    settled = timezone.now() - timedelta(seconds=settings.ALERT_FANOUT_DELAY)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(PENDING_SQL, [settled, batch_size])
+        coupons = [row[0] for row in cursor.fetchall()]
+        if coupons:
+            cursor.execute(ALERTS_SQL, {
+                'subject': "Hot offer",
+                'template': "main/email/hot-offer",
+                'site_url': settings.SITE_URL,
+                'coupons': coupons,
+            })
+    return len(coupons)
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.utils import jwt_payload_handler as default_jwt_payload_handler
+
+from main.cache import user_cache_key
+
+
+def jwt_payload_handler(user):
+    payload = default_jwt_payload_handler(user)
+    payload['atype'] = user.atype
+    if user.atype == "V":
+        payload['verified'] = user.vendor.verified
+        payload['restricted'] = user.vendor.restricted
+    return payload
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    Loads the user together with the vendor/consumer profile and keeps it in the short-lived in-process
+    `users` cache, so authentication and permission checks don't hit the database on every request.
+    Entries are dropped whenever the user or the profile is saved.
+    """
+
+    def authenticate_credentials(self, payload):
+        user_id = payload.get('user_id')
+        if user_id is None:
+            raise exceptions.AuthenticationFailed('Invalid payload.')
+        key = user_cache_key(user_id)
+        user = caches['users'].get(key)
+        if user is None:
+            try:
+                user = get_user_model().objects.select_related('vendor', 'consumer').get(pk=user_id)
+            except get_user_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid signature.')
+            caches['users'].set(key, user)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User account is disabled.')
+        return user
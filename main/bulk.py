@@ -0,0 +1,248 @@
+import codecs
+import csv
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework.exceptions import ParseError
+
+from main.models import Organization, Campaign, Outlet, Coupon, Type, Category, Interest, FeedCandidate, touch, \
+    refresh_search_vectors
+from main.parsers import iter_ndjson
+from main.serializers import BulkCouponSerializer, OutletRowSerializer
+
+# Item field, its validated name and the model its ids refer to, checked with one query per model
+REFERENCES = [
+    ('ctype', 'ctype_id', Type),
+    ('category', 'category_id', Category),
+    ('interests', 'interests', Interest),
+]
+M2M = {
+    'interests': (Coupon.interests.through, 'interest_id'),
+    'outlets': (Coupon.outlets.through, 'outlet_id'),
+}
+
+UPDATE_SQL = """
+UPDATE main_coupon c SET {assignments}, updated_at = now()
+FROM (VALUES {rows}) AS v(id, {columns})
+WHERE c.id = v.id
+"""
+
+
+OUTLET_COLUMNS = ['external_id', 'name', 'description', 'address', 'latitude', 'longitude']
+OUTLET_ROW = "(%s::text, %s::text, %s::text, %s::text, %s::float8, %s::float8)"
+
+# geom is computed from the same values, as the outlet_geom_matches_coordinates constraint demands
+IMPORT_OUTLETS_SQL = """
+INSERT INTO main_outlet (organization_id, owner_id, external_id, name, description, address, latitude, longitude,
+                         geom, updated_at)
+SELECT %s, %s, v.external_id, v.name, v.description, v.address, v.latitude, v.longitude,
+       ST_SetSRID(ST_MakePoint(v.longitude, v.latitude), 4326), now()
+FROM (VALUES {rows}) AS v(external_id, name, description, address, latitude, longitude)
+ON CONFLICT (organization_id, external_id) {action}
+RETURNING xmax = 0
+"""
+UPSERT = """DO UPDATE SET name = EXCLUDED.name, description = EXCLUDED.description, address = EXCLUDED.address,
+    latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude, geom = EXCLUDED.geom, updated_at = EXCLUDED.updated_at"""
+
+IMPORT_FORMATS = ['csv', 'ndjson']
+
+
+def _ids(value):
+    return value if isinstance(value, list) else [value]
+
+
+class BulkCouponWriter:
+    """
+    Creates and updates the coupons of one /api/coupons/bulk request. Items are validated one by one
+    without queries, then ownership and references are checked for the whole batch with a query per model.
+    Nothing is written unless every item is valid, errors are reported per item like a `many=True` serializer.
+    Rows and m2m links are written with bulk inserts and an UPDATE per set of changed fields, all in one
+    transaction, followed by the bookkeeping Coupon.save and the m2m signals would do one row at a time.
+    """
+
+    def __init__(self, items: list, user):
+        self.items = items
+        self.user = user
+        self.data = []
+        self.errors = []
+
+    def is_valid(self) -> bool:
+        for item in self.items:
+            serializer = BulkCouponSerializer(data=item, partial=isinstance(item, dict) and 'id' in item)
+            serializer.is_valid()
+            self.data.append(serializer.validated_data if not serializer.errors else None)
+            self.errors.append(dict(serializer.errors))
+        self._check_references()
+        return not any(self.errors)
+
+    def _add_error(self, index: int, field: str, message: str):
+        self.errors[index].setdefault(field, []).append(message)
+
+    def _check_references(self):
+        valid = [(index, data) for index, data in enumerate(self.data) if data is not None]
+
+        def owners(model, field):
+            ids = {pk for _, data in valid for pk in _ids(data.get(field, []))}
+            return dict(model.objects.filter(id__in=ids).values_list('id', 'owner_id')) if ids else {}
+
+        campaigns = owners(Campaign, 'campaign_id')
+        outlets = owners(Outlet, 'outlets')
+        coupons = owners(Coupon, 'id')
+        existing = {}
+        for _, source, model in REFERENCES:
+            ids = {pk for _, data in valid for pk in _ids(data.get(source, []))}
+            existing[source] = set(model.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+
+        updated = set()
+        for index, data in valid:
+            if 'id' in data:
+                if coupons.get(data['id']) != self.user.id:
+                    self._add_error(index, 'id', "Not found.")
+                elif data['id'] in updated:
+                    self._add_error(index, 'id', "Coupon is changed by another item.")
+                updated.add(data['id'])
+            if 'campaign_id' in data and campaigns.get(data['campaign_id']) != self.user.id:
+                self._add_error(index, 'campaign', "You must be an owner of this campaign")
+            if any(outlets.get(pk) != self.user.id for pk in data.get('outlets', [])):
+                self._add_error(index, 'outlets', "You must be an owner of this outlet")
+            for field, source, _ in REFERENCES:
+                for pk in _ids(data.get(source, [])):
+                    if pk not in existing[source]:
+                        self._add_error(index, field, 'Invalid pk "{}" - object does not exist.'.format(pk))
+
+    def save(self) -> list:
+        """Writes the batch and returns the coupon ids in item order."""
+        if not self.data:
+            return []
+        with transaction.atomic():
+            created = [Coupon(owner_id=self.user.id, **self._fields(data)) for data in self.data if 'id' not in data]
+            Coupon.objects.bulk_create(created)
+            created = iter(created)
+            ids = [data['id'] if 'id' in data else next(created).id for data in self.data]
+            # Campaigns list their coupons, so the ones coupons move away from change too
+            moved = [data['id'] for data in self.data if 'id' in data and 'campaign_id' in data]
+            campaigns = set(Coupon.objects.filter(pk__in=moved).values_list('campaign_id', flat=True)) \
+                if moved else set()
+
+            groups = defaultdict(list)
+            for data in self.data:
+                if 'id' in data:
+                    fields = self._fields(data)
+                    groups[tuple(sorted(fields))].append((data['id'], fields))
+            for names, rows in groups.items():
+                if names:
+                    self._update(names, rows)
+                else:
+                    # Only links change, the coupons list them
+                    touch(Coupon.objects.filter(pk__in=[coupon_id for coupon_id, _ in rows]))
+
+            outlets = set()
+            for data in self.data:
+                if 'id' not in data or 'campaign_id' in data:
+                    campaigns.add(data['campaign_id'])
+            for field, (through, column) in M2M.items():
+                changed = [(coupon_id, data[field]) for coupon_id, data in zip(ids, self.data) if field in data]
+                replaced = [coupon_id for coupon_id, data in zip(ids, self.data) if 'id' in data and field in data]
+                if field == 'outlets':
+                    outlets.update(through.objects.filter(coupon_id__in=replaced).values_list(column, flat=True))
+                    outlets.update(pk for _, pks in changed for pk in pks)
+                through.objects.filter(coupon_id__in=replaced).delete()
+                through.objects.bulk_create([through(coupon_id=coupon_id, **{column: pk})
+                                             for coupon_id, pks in changed for pk in set(pks)])
+                if field == 'interests':
+                    FeedCandidate.queue_coupons([coupon_id for coupon_id, _ in changed])
+
+            touch(Campaign.objects.filter(pk__in=campaigns))
+            touch(Outlet.objects.filter(pk__in=outlets))
+            refresh_search_vectors(Coupon.objects.filter(pk__in=ids))
+        return ids
+
+    @staticmethod
+    def _fields(data: dict) -> dict:
+        return {name: value for name, value in data.items() if name != 'id' and name not in M2M}
+
+    @staticmethod
+    def _update(names: tuple, rows: list):
+        fields = [Coupon._meta.get_field(name) for name in names]
+        columns = [connection.ops.quote_name(field.column) for field in fields]
+        row = "(%s::integer, {})".format(", ".join("%s::{}".format(field.db_type(connection)) for field in fields))
+        params = []
+        for coupon_id, values in rows:
+            params.append(coupon_id)
+            params.extend(field.get_db_prep_save(values[name], connection) for name, field in zip(names, fields))
+        with connection.cursor() as cursor:
+            cursor.execute(UPDATE_SQL.format(
+                assignments=", ".join("{0} = v.{0}".format(column) for column in columns),
+                rows=", ".join([row] * len(rows)),
+                columns=", ".join(columns),
+            ), params)
+
+
+def _outlet_rows(stream, import_format: str):
+    if import_format == 'csv':
+        # Excel puts a byte order mark in front of UTF-8 exports
+        return csv.DictReader(codecs.iterdecode(iter(stream.readline, b''), 'utf-8-sig'))
+    return iter_ndjson(stream)
+
+
+def import_outlets(stream, import_format: str, organization: Organization, upsert: bool = False,
+                   chunk_size: int = None) -> dict:
+    """
+    Reads outlets from a binary CSV or NDJSON stream, `chunk_size` rows at a time, so memory does not grow
+    with the file. Valid rows of a chunk are inserted by one statement committed on its own, together with
+    their geoms. Rows whose external_id the organization already has are skipped, or update that outlet
+    if `upsert` is set. Returns the number of created, updated, skipped and failed rows,
+    and the errors of the first OUTLET_IMPORT_MAX_ERRORS failed ones.
+    """
+    chunk_size = chunk_size or settings.OUTLET_IMPORT_CHUNK_SIZE
+    result = {'created': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+
+    def fail(row: int, errors):
+        result['failed'] += 1
+        if len(result['errors']) < settings.OUTLET_IMPORT_MAX_ERRORS:
+            result['errors'].append({'row': row, 'errors': errors})
+
+    rows = _outlet_rows(stream, import_format)
+    row, unreadable = 0, None
+    while unreadable is None:
+        chunk = []
+        try:
+            for data in rows:
+                row += 1
+                chunk.append((row, data))
+                if len(chunk) == chunk_size:
+                    break
+        except (ParseError, csv.Error, UnicodeDecodeError) as e:
+            # The rest of the file can't be read, the rows before it are still imported
+            unreadable = {'non_field_errors': [str(e)]}
+        if not chunk:
+            break
+        # Later rows win over earlier ones with the same external_id, one statement can't update a row twice
+        valid = {}
+        for number, data in chunk:
+            serializer = OutletRowSerializer(data=data)
+            if serializer.is_valid():
+                key = serializer.validated_data.get('external_id') or ('row', number)
+                if key in valid:
+                    result['skipped'] += 1
+                valid[key] = serializer.validated_data
+            else:
+                fail(number, serializer.errors)
+        if not valid:
+            continue
+        params = [organization.id, organization.get_owner_id()]
+        for data in valid.values():
+            params.extend(data.get(column) for column in OUTLET_COLUMNS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(IMPORT_OUTLETS_SQL.format(rows=", ".join([OUTLET_ROW] * len(valid)),
+                                                     action=UPSERT if upsert else "DO NOTHING"), params)
+            written = [inserted for inserted, in cursor.fetchall()]
+        result['created'] += sum(written)
+        result['updated'] += len(written) - sum(written)
+        result['skipped'] += len(valid) - len(written)
+    if unreadable is not None:
+        fail(row + 1, unreadable)
+    if result['created'] or result['updated']:
+        touch(Organization.objects.filter(pk=organization.pk))
+    return result
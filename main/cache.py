@@ -0,0 +1,62 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+
+def user_cache_key(user_id) -> str:
+    return "user:{}".format(user_id)
+
+
+def invalidate_user(user_id):
+    caches['users'].delete(user_cache_key(user_id))
+
+
+def reference_version_key(name) -> str:
+    return "reference:{}:version".format(name)
+
+
+def reference_version(name) -> int:
+    """
+    Current version of a reference table. A lost version key restarts from the clock,
+    never from a number that may still address old entries.
+    """
+    cache = caches['default']
+    key = reference_version_key(name)
+    cache.add(key, int(time.time() * 1000), None)
+    return cache.get(key)
+
+
+def bump_reference_version(name):
+    """
+    Moves a reference table to a new version once the current transaction commits,
+    so a read in between can't cache the old rows under the new version.
+    """
+    def bump():
+        cache = caches['default']
+        try:
+            cache.incr(reference_version_key(name))
+        except ValueError:
+            reference_version(name)
+
+    transaction.on_commit(bump)
+
+
+def cached_reference(name, load) -> dict:
+    """
+    Returns {"etag": ..., "data": ...} for the current version of a reference table,
+    calling `load` to build the data on a miss.
+    """
+    cache = caches['default']
+    key = "reference:{}:{}".format(name, reference_version(name))
+    entry = cache.get(key)
+    if entry is None:
+        data = load()
+        digest = hashlib.sha1(json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+        entry = {"etag": '"{}"'.format(digest), "data": data}
+        cache.set(key, entry, settings.REFERENCE_CACHE_TTL)
+    return entry
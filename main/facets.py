@@ -0,0 +1,44 @@
+from django.db import connection
+
+from main.models import Coupon
+
+# All facets and the totals of the filtered coupons in one scan, the grouping mask tells which set
+# a row belongs to. Joining interests repeats a coupon once per interest, hence the distinct count.
+FACETS_SQL = """
+SELECT GROUPING(c.category_id, c.ctype_id, ci.interest_id), c.category_id, c.ctype_id, ci.interest_id,
+       COUNT(DISTINCT c.id), MAX(c.updated_at)
+FROM ({coupons}) c LEFT JOIN {interests} ci ON ci.coupon_id = c.id
+GROUP BY GROUPING SETS ((c.category_id), (c.ctype_id), (ci.interest_id), ())
+"""
+
+TOTALS = 0b111
+
+FACETS = {
+    0b011: ("category", 1),
+    0b101: ("ctype", 2),
+    0b110: ("interests", 3),
+}
+
+
+def coupon_facets(queryset) -> tuple:
+    """
+    Number of coupons in the queryset per category, type and interest,
+    as {"category": [{"id": ..., "count": ...}, ...], ...} ordered by count,
+    followed by the number of coupons and their latest updated_at.
+    """
+    sql, params = queryset.order_by().values('id', 'category_id', 'ctype_id', 'updated_at').query.sql_with_params()
+    facets = {name: [] for name, _ in FACETS.values()}
+    count, updated_at = 0, None
+    with connection.cursor() as cursor:
+        cursor.execute(FACETS_SQL.format(coupons=sql, interests=Coupon.interests.through._meta.db_table), params)
+        for row in cursor.fetchall():
+            if row[0] == TOTALS:
+                count, updated_at = row[4], row[5]
+                continue
+            name, column = FACETS[row[0]]
+            # Coupons without interests
+            if row[column] is not None:
+                facets[name].append({"id": row[column], "count": row[4]})
+    for values in facets.values():
+        values.sort(key=lambda value: (-value["count"], value["id"]))
+    return facets, count, updated_at
@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from main.models import Coupon, FeedCandidate
+
+# Shared interests first, then the average rating and how recently the coupon started
+SCORE = """
+COUNT(*) * %(interest)s
++ COALESCE(c.rating_sum::float / NULLIF(c.ratings, 0), 0) * %(rating)s
++ %(recency)s / (1 + GREATEST(EXTRACT(EPOCH FROM now() - c.start), 0) / 86400)
+"""
+
+# Live coupons sharing interests with consumers, scored, per (consumer, coupon)
+MATCHES = """
+SELECT ci.consumer_id, c.id AS coupon_id, COUNT(*) AS overlap, {score} AS score
+FROM main_consumer_interests ci
+JOIN main_coupon_interests ki ON ki.interest_id = ci.interest_id
+JOIN main_coupon c ON c.id = ki.coupon_id
+WHERE {condition} AND c.live
+GROUP BY ci.consumer_id, c.id
+""".format(score=SCORE, condition="{condition}")
+
+UPSERT = "ON CONFLICT (consumer_id, coupon_id) DO UPDATE SET overlap = EXCLUDED.overlap, score = EXCLUDED.score"
+
+STALE_CONSUMERS_SQL = """
+SELECT id FROM main_consumer WHERE feed_refreshed IS NULL OR feed_refreshed < %s
+ORDER BY feed_refreshed NULLS FIRST, id LIMIT %s FOR UPDATE SKIP LOCKED
+"""
+
+# The best FEED_SIZE matches of every consumer
+REBUILD_SQL = """
+INSERT INTO main_feedcandidate (consumer_id, coupon_id, overlap, score)
+SELECT consumer_id, coupon_id, overlap, score FROM (
+    SELECT m.*, row_number() OVER (PARTITION BY m.consumer_id ORDER BY m.score DESC, m.coupon_id) AS position
+    FROM ({matches}) m
+) r
+WHERE position <= %(size)s
+{upsert}
+""".format(matches=MATCHES.format(condition="ci.consumer_id = ANY(%(ids)s)"), upsert=UPSERT)
+
+FLOOR_SQL = """
+UPDATE main_consumer p SET feed_refreshed = now(), feed_floor = (
+    SELECT f.score FROM main_feedcandidate f WHERE f.consumer_id = p.id
+    ORDER BY f.score DESC, f.coupon_id OFFSET (%(size)s - 1) LIMIT 1
+)
+WHERE p.id = ANY(%(ids)s)
+"""
+
+PENDING_COUPONS_SQL = """
+UPDATE main_coupon SET feed_pending = false
+WHERE id IN (SELECT id FROM main_coupon WHERE feed_pending ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED)
+RETURNING id
+"""
+
+# Only into feeds that are not full or whose last coupon they match, which may be the coupon itself
+# coming back after an edit. Rebuilds trim them back to FEED_SIZE.
+MERGE_SQL = """
+INSERT INTO main_feedcandidate (consumer_id, coupon_id, overlap, score)
+SELECT m.consumer_id, m.coupon_id, m.overlap, m.score
+FROM ({matches}) m JOIN main_consumer p ON p.id = m.consumer_id
+WHERE p.feed_floor IS NULL OR m.score >= p.feed_floor
+{upsert}
+""".format(matches=MATCHES.format(condition="c.id = ANY(%(ids)s)"), upsert=UPSERT)
+
+FEED_SQL = """
+SELECT c.id
+FROM {candidates} f JOIN {coupons} c ON c.id = f.coupon_id
+WHERE f.consumer_id = %(consumer)s AND c.live
+ORDER BY f.score DESC, f.coupon_id
+LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+
+def consumer_feed(consumer, limit: int, offset: int = 0) -> list:
+    """
+    Live coupons from the consumer's precomputed candidates, best first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(FEED_SQL.format(candidates=FeedCandidate._meta.db_table, coupons=Coupon._meta.db_table), {
+            'consumer': consumer.id,
+            'limit': limit,
+            'offset': offset,
+        })
+        ids = [row[0] for row in cursor.fetchall()]
+    coupons = Coupon.objects.filter(id__in=ids).select_related('ctype', 'category') \
+        .prefetch_related('interests', 'outlets').in_bulk()
+    return [coupons[coupon_id] for coupon_id in ids if coupon_id in coupons]
+
+
+def _params(**params) -> dict:
+    params.update(interest=settings.FEED_INTEREST_WEIGHT, rating=settings.FEED_RATING_WEIGHT,
+                  recency=settings.FEED_RECENCY_WEIGHT, size=settings.FEED_SIZE)
+    return params
+
+
+def refresh_feeds(batch_size: int = None) -> int:
+    """
+    Merges at most `batch_size` coupons that went live or changed interests into the feeds of consumers
+    sharing them, then rebuilds the candidates of at most `batch_size` consumers whose interests changed
+    or whose feed is FEED_REFRESH_AGE seconds old, so ratings and recency are current. Every batch is
+    committed on its own. Returns the number of coupons and consumers processed.
+    """
+    batch_size = batch_size or settings.FEED_REFRESH_BATCH_SIZE
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(PENDING_COUPONS_SQL, [batch_size])
+        coupons = [row[0] for row in cursor.fetchall()]
+        if coupons:
+            FeedCandidate.objects.filter(coupon_id__in=coupons).delete()
+            cursor.execute(MERGE_SQL, _params(ids=coupons))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(STALE_CONSUMERS_SQL, [timezone.now() - timedelta(seconds=settings.FEED_REFRESH_AGE),
+                                             batch_size])
+        consumers = [row[0] for row in cursor.fetchall()]
+        if consumers:
+            FeedCandidate.objects.filter(consumer_id__in=consumers).delete()
+            cursor.execute(REBUILD_SQL, _params(ids=consumers))
+            cursor.execute(FLOOR_SQL, _params(ids=consumers))
+    return len(coupons) + len(consumers)
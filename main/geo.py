@@ -0,0 +1,28 @@
+from math import cos, radians
+
+from django.contrib.gis.db.models import PointField
+from django.db.models import FloatField, Func, Value
+
+# Metres in one degree of latitude (and of longitude on the equator)
+METERS_PER_DEGREE = 111320.0
+
+
+class KNNDistance(Func):
+    """
+    PostGIS `<->` operator. Ordering by it together with a LIMIT lets Postgres
+    walk the GiST index of the column instead of sorting every row.
+    """
+    arg_joiner = ' <-> '
+    template = '(%(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, point, **extra):
+        super(KNNDistance, self).__init__(expression, Value(point, output_field=PointField(srid=4326)), **extra)
+
+
+def radius_to_degrees(radius: float, latitude: float) -> float:
+    """
+    Converts a radius in metres to degrees, wide enough to cover it in every direction at the given latitude.
+    Used for index-assisted `dwithin` prefilters on srid 4326 geometries.
+    """
+    return radius / (METERS_PER_DEGREE * max(cos(radians(latitude)), 0.01))
@@ -0,0 +1,107 @@
+import logging
+import os
+import time
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from main.models import Coupon
+
+logger = logging.getLogger(__name__)
+
+PENDING_SQL = """
+SELECT id FROM main_coupon WHERE image IS DISTINCT FROM variants->>'source' ORDER BY id LIMIT %s
+"""
+
+# Format -> file extension, every size is stored in all of them
+FORMATS = [('WEBP', 'webp'), ('JPEG', 'jpeg')]
+
+
+def render_variants(coupon: Coupon) -> dict:
+    """
+    Stores a copy of the coupon image per IMAGE_VARIANTS size and format, never upscaled,
+    and returns them as `Coupon.variants`. Images that can't be rendered get no sizes, clients keep the original.
+    """
+    try:
+        sizes = _render_sizes(coupon)
+    except Exception:
+        # Corrupt files, decompression bombs, broken EXIF... must not stop the worker on this coupon
+        logger.warning("Cannot render variants of coupon %s image %s", coupon.id, coupon.image.name, exc_info=True)
+        sizes = {}
+    return {'source': coupon.image.name, 'sizes': sizes}
+
+
+def _render_sizes(coupon: Coupon) -> dict:
+    with coupon.image.open('rb') as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode != 'RGB':
+        # Transparent parts become white, JPEG has no alpha channel
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', image.size, 'white')
+        image.paste(rgba, mask=rgba)
+    stem = os.path.splitext(os.path.basename(coupon.image.name))[0]
+    sizes = {}
+    for size, dimension in settings.IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((dimension, dimension), Image.LANCZOS)
+        sizes[size] = {}
+        for image_format, extension in FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, image_format, quality=settings.IMAGE_VARIANT_QUALITY)
+            name = "coupons/variants/{}-{}.{}".format(stem, size, extension)
+            sizes[size][extension] = coupon.image.storage.save(name, ContentFile(buffer.getvalue()))
+    return sizes
+
+
+def render_images(batch_size: int = None) -> int:
+    """
+    Renders variants of at most `batch_size` coupons whose image changed, each in its own transaction
+    holding only that coupon's row. Coupons sharing an image share its variants, rendered once.
+    Replaced variants are left to `collect_blobs`. Returns the number of coupons processed.
+    """
+    batch_size = batch_size or settings.IMAGE_RENDER_BATCH_SIZE
+    with connection.cursor() as cursor:
+        cursor.execute(PENDING_SQL, [batch_size])
+        ids = [row[0] for row in cursor.fetchall()]
+    for coupon_id in ids:
+        with transaction.atomic():
+            coupon = Coupon.objects.select_for_update(skip_locked=True).filter(pk=coupon_id).first()
+            if coupon is None or coupon.variants.get('source') == coupon.image.name:
+                # Another worker has it or just did it
+                continue
+            rendered = Coupon.objects.filter(variants__source=coupon.image.name).exclude(pk=coupon.pk) \
+                .values_list('variants', flat=True).first()
+            coupon.variants = rendered or render_variants(coupon)
+            # A new updated_at, so cached responses and sync clients pick the variants up
+            coupon.save(update_fields=['variants', 'updated_at'])
+    return len(ids)
+
+
+def collect_blobs(grace: int = None) -> int:
+    """
+    Deletes coupon images and variants no coupon refers to anymore. Only files older than `grace`
+    seconds go, so blobs saved for rows that are not committed yet survive.
+    Returns the number of deleted files.
+    """
+    grace = settings.BLOB_GC_GRACE if grace is None else grace
+    storage = Coupon._meta.get_field('image').storage
+    cutoff = time.time() - grace
+    candidates = [name for name in storage.blobs('coupons') if os.path.getmtime(storage.path(name)) < cutoff]
+    if not candidates:
+        return 0
+    referenced = set()
+    for image, variants in Coupon.objects.values_list('image', 'variants').iterator():
+        referenced.add(image)
+        for formats in variants.get('sizes', {}).values():
+            referenced.update(formats.values())
+    deleted = 0
+    for name in candidates:
+        # Saving identical content again refreshes the mtime, such a blob is about to be referenced
+        if name not in referenced and os.path.getmtime(storage.path(name)) < cutoff:
+            storage.delete(name)
+            deleted += 1
+    return deleted
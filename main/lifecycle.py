@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import connection
+
+from main.models import Campaign, Coupon, FeedCandidate
+
+# Rows whose `live` flag no longer matches the clock: live ones past their end and started ones
+# waiting to go live. The trigger recomputes `live`, the sweeper only has to touch them.
+EXPIRED_COUPONS = 'live AND "end" < now()'
+SWEEPS = [
+    (Coupon, EXPIRED_COUPONS),
+    (Coupon, 'NOT live AND active AND published AND start <= now() AND "end" >= now()'),
+    (Campaign, 'live AND "end" < now()'),
+    (Campaign, 'NOT live AND active AND start <= now() AND "end" >= now()'),
+]
+
+SWEEP_SQL = """
+UPDATE {table} SET live = NOT live
+WHERE id IN (SELECT id FROM {table} WHERE {condition} LIMIT %s FOR UPDATE SKIP LOCKED)
+RETURNING id
+"""
+
+
+def sweep_lifecycle(batch_size: int = None) -> int:
+    """
+    Flips `live` of coupons and campaigns that crossed their start or end, at most `batch_size`
+    rows per kind of change, every batch committed on its own. Ended coupons also leave the consumer feeds.
+    Returns the number of rows flipped.
+    """
+    batch_size = batch_size or settings.LIFECYCLE_SWEEP_BATCH_SIZE
+    flipped = 0
+    with connection.cursor() as cursor:
+        for model, condition in SWEEPS:
+            cursor.execute(SWEEP_SQL.format(table=model._meta.db_table, condition=condition), [batch_size])
+            ids = [row[0] for row in cursor.fetchall()]
+            if condition == EXPIRED_COUPONS:
+                FeedCandidate.objects.filter(coupon_id__in=ids).delete()
+            flipped += len(ids)
+    return flipped
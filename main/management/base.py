@@ -0,0 +1,54 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class WorkerCommand(BaseCommand):
+    """
+    A background job looping in its own compose service. `run` does one round and returns how much
+    it processed. Rounds follow each other while they find work and the worker sleeps --interval
+    seconds once one comes back empty, or after every round unless `drain` is set. Failed rounds
+    are logged and retried after the interval. With --once it exits when nothing is left and
+    raises errors instead.
+    """
+    # Settings with the defaults of --interval and, if the job works in batches, of --batch-size
+    interval_setting = None
+    batch_size_setting = None
+    once_help = "Process everything that is due and exit"
+    interval_help = "Seconds to sleep when nothing is due"
+    batch_size_help = None
+    # Run the next round right away while rounds find work
+    drain = True
+    error_message = None
+    # Logged with the result of every round, if set
+    result_message = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help=self.once_help)
+        if self.batch_size_setting is not None:
+            parser.add_argument('--batch-size', type=int, default=getattr(settings, self.batch_size_setting),
+                                help=self.batch_size_help)
+        parser.add_argument('--interval', type=float, default=getattr(settings, self.interval_setting),
+                            help=self.interval_help)
+
+    def run(self, **options) -> int:
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        logger = logging.getLogger(self.__module__)
+        while True:
+            try:
+                processed = self.run(**options)
+                if self.result_message is not None:
+                    logger.info(self.result_message, processed)
+            except Exception:
+                if options['once']:
+                    raise
+                logger.exception(self.error_message)
+                processed = 0
+            if not (self.drain and processed):
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+from django.conf import settings
+
+from main.images import collect_blobs
+from main.management.base import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = "Deletes coupon images and image variants no coupon refers to"
+    once_help = "Collect once and exit"
+    interval_setting = 'BLOB_GC_INTERVAL'
+    interval_help = "Seconds between collections"
+    drain = False
+    error_message = "Failed to collect coupon images"
+    result_message = "Deleted %d unreferenced coupon images"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--grace', type=int, default=settings.BLOB_GC_GRACE,
+                            help="Seconds a file has to be old before it is deleted")
+
+    def run(self, **options) -> int:
+        return collect_blobs(options['grace'])
@@ -0,0 +1,17 @@
+from main.management.base import WorkerCommand
+from main.sync import compact_changes
+
+
+class Command(WorkerCommand):
+    help = "Removes coupon changes superseded by a later change of the same coupon"
+    once_help = "Compact once and exit"
+    interval_setting = 'SYNC_COMPACT_INTERVAL'
+    batch_size_setting = 'SYNC_COMPACT_BATCH_SIZE'
+    batch_size_help = "Change ids compacted per statement"
+    interval_help = "Seconds between compactions"
+    drain = False
+    error_message = "Failed to compact coupon changes"
+    result_message = "Removed %d superseded coupon changes"
+
+    def run(self, **options) -> int:
+        return compact_changes(options['batch_size'])
@@ -0,0 +1,15 @@
+from main.alerts import fan_out_alerts
+from main.management.base import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = "Queues hot offer emails for coupons that went live"
+    once_help = "Process every pending coupon and exit"
+    interval_setting = 'ALERT_FANOUT_INTERVAL'
+    interval_help = "Seconds to sleep when no coupon is pending"
+    batch_size_setting = 'ALERT_FANOUT_BATCH_SIZE'
+    batch_size_help = "Coupons per transaction"
+    error_message = "Failed to fan out hot offer alerts"
+
+    def run(self, **options) -> int:
+        return fan_out_alerts(options['batch_size'])
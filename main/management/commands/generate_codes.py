@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Coupon
+
+
+class Command(BaseCommand):
+    help = "Adds unique per-redemption codes to the pool of a coupon"
+
+    def add_arguments(self, parser):
+        parser.add_argument('coupon', type=int)
+        parser.add_argument('count', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            coupon = Coupon.objects.get(pk=options['coupon'])
+        except Coupon.DoesNotExist:
+            raise CommandError("Coupon {} does not exist".format(options['coupon']))
+        if options['count'] < 1:
+            raise CommandError("Count must be positive")
+        coupon.generate_codes(options['count'])
+        self.stdout.write("{} codes left in the pool".format(coupon.codes_left))
@@ -0,0 +1,34 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.bulk import IMPORT_FORMATS, import_outlets
+from main.models import Organization
+
+
+class Command(BaseCommand):
+    help = "Imports the outlets of an organization from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV with a header row, or one JSON object per line")
+        parser.add_argument('--organization', type=int, required=True)
+        parser.add_argument('--upsert', action='store_true',
+                            help="Update outlets with the external_id of a row instead of skipping the row")
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help="Taken from the file extension by default")
+        parser.add_argument('--chunk-size', type=int, help="Rows inserted per statement")
+
+    def handle(self, *args, **options):
+        import_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError("Unknown format, pass --format")
+        try:
+            organization = Organization.objects.select_related('vendor').get(pk=options['organization'])
+        except Organization.DoesNotExist:
+            raise CommandError("Organization {} does not exist".format(options['organization']))
+        with open(options['path'], 'rb') as f:
+            result = import_outlets(f, import_format, organization, options['upsert'], options['chunk_size'])
+        for error in result['errors']:
+            self.stderr.write("Row {}: {}".format(error['row'], json.dumps(error['errors'])))
+        self.stdout.write("Created {created}, updated {updated}, skipped {skipped}, failed {failed}".format(**result))
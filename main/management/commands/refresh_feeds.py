@@ -0,0 +1,13 @@
+from main.feed import refresh_feeds
+from main.management.base import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = "Merges coupons going live into consumer feeds and rebuilds stale feeds"
+    once_help = "Refresh everything that is due and exit"
+    interval_setting = 'FEED_REFRESH_INTERVAL'
+    batch_size_setting = 'FEED_REFRESH_BATCH_SIZE'
+    error_message = "Failed to refresh consumer feeds"
+
+    def run(self, **options) -> int:
+        return refresh_feeds(options['batch_size'])
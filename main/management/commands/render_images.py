@@ -0,0 +1,14 @@
+from main.images import render_images
+from main.management.base import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = "Renders thumbnails and WebP copies of new coupon images"
+    once_help = "Render every pending image and exit"
+    interval_setting = 'IMAGE_RENDER_INTERVAL'
+    interval_help = "Seconds to sleep when no image is pending"
+    batch_size_setting = 'IMAGE_RENDER_BATCH_SIZE'
+    error_message = "Failed to render coupon images"
+
+    def run(self, **options) -> int:
+        return render_images(options['batch_size'])
@@ -0,0 +1,14 @@
+from main.management.base import WorkerCommand
+from main.stats import roll_up_events
+
+
+class Command(WorkerCommand):
+    help = "Rolls coupon events up into per-minute, per-hour and per-day statistics"
+    once_help = "Roll up everything that is settled and exit"
+    interval_setting = 'STATS_ROLLUP_INTERVAL'
+    interval_help = "Seconds to sleep when there are no new events"
+    batch_size_setting = 'STATS_ROLLUP_BATCH_SIZE'
+    error_message = "Failed to roll up statistics"
+
+    def run(self, **options) -> int:
+        return roll_up_events(options['batch_size'])
@@ -0,0 +1,15 @@
+from main.management.base import WorkerCommand
+from main.outbox import send_queued_emails
+
+
+class Command(WorkerCommand):
+    help = "Delivers emails queued in the outbox"
+    once_help = "Send everything that is due and exit"
+    interval_setting = 'EMAIL_OUTBOX_POLL_INTERVAL'
+    interval_help = "Seconds to sleep when the outbox is empty"
+    batch_size_setting = 'EMAIL_OUTBOX_BATCH_SIZE'
+    # Mail server is unreachable, rows stay untouched until the next try
+    error_message = "Failed to send queued emails"
+
+    def run(self, **options) -> int:
+        return send_queued_emails(options['batch_size'])
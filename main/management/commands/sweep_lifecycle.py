@@ -0,0 +1,13 @@
+from main.lifecycle import sweep_lifecycle
+from main.management.base import WorkerCommand
+
+
+class Command(WorkerCommand):
+    help = "Flips coupons and campaigns live or not live as they reach their start and end"
+    once_help = "Sweep everything that is due and exit"
+    interval_setting = 'LIFECYCLE_SWEEP_INTERVAL'
+    batch_size_setting = 'LIFECYCLE_SWEEP_BATCH_SIZE'
+    error_message = "Failed to sweep coupon and campaign lifecycle"
+
+    def run(self, **options) -> int:
+        return sweep_lifecycle(options['batch_size'])
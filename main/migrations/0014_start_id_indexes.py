@@ -0,0 +1,21 @@
+# Generated by Django 2.0.5 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_campaign_active'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(fields=['start', 'id'], name='campaign_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(fields=['start', 'id'], name='coupon_start_id_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.0.5 on 2026-10-18 11:00
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+from django.db import migrations
+from django.db.models import Max
+
+BATCH_SIZE = 10000
+
+
+def _rewrite_geoms(apps, schema_editor, x, y):
+    Outlet = apps.get_model('main', 'Outlet')
+    last = Outlet.objects.aggregate(last=Max('id'))['last'] or 0
+    with schema_editor.connection.cursor() as cursor:
+        # The migration is not atomic, so every batch is committed on its own and rows are not locked all at once.
+        # Rewriting is idempotent, an interrupted run can simply be restarted.
+        for start in range(0, last + 1, BATCH_SIZE):
+            cursor.execute(
+                "UPDATE main_outlet SET geom = ST_SetSRID(ST_MakePoint({}, {}), 4326) "
+                "WHERE id >= %s AND id < %s".format(x, y),
+                [start, start + BATCH_SIZE]
+            )
+
+
+def lon_lat_geoms(apps, schema_editor):
+    _rewrite_geoms(apps, schema_editor, 'longitude', 'latitude')
+
+
+def lat_lon_geoms(apps, schema_editor):
+    _rewrite_geoms(apps, schema_editor, 'latitude', 'longitude')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0014_start_id_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(lon_lat_geoms, lat_lon_geoms),
+        # Replace the implicit spatial index with an explicit one
+        migrations.AlterField(
+            model_name='outlet',
+            name='geom',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, spatial_index=False, srid=4326),
+        ),
+        migrations.RunSQL(
+            "DROP INDEX IF EXISTS main_outlet_geom_id",
+            "CREATE INDEX IF NOT EXISTS main_outlet_geom_id ON main_outlet USING GIST (geom)",
+        ),
+        migrations.AddIndex(
+            model_name='outlet',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['geom'], name='outlet_geom_gist_idx'),
+        ),
+        # Added without checking the existing rows, which would hold an ACCESS EXCLUSIVE lock for the whole scan,
+        # then validated on its own under a lock that lets reads and writes through
+        migrations.RunSQL(
+            "ALTER TABLE main_outlet ADD CONSTRAINT outlet_geom_matches_coordinates "
+            "CHECK (ST_SRID(geom) = 4326 AND ST_X(geom) = longitude AND ST_Y(geom) = latitude) NOT VALID",
+            "ALTER TABLE main_outlet DROP CONSTRAINT outlet_geom_matches_coordinates",
+        ),
+        migrations.RunSQL(
+            "ALTER TABLE main_outlet VALIDATE CONSTRAINT outlet_geom_matches_coordinates",
+            migrations.RunSQL.noop,
+        ),
+    ]
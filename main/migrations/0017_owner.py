@@ -0,0 +1,47 @@
+# Generated by Django 2.0.5 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0016_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunSQL(
+            [
+                "UPDATE main_campaign SET owner_id = main_vendor.user_id "
+                "FROM main_organization JOIN main_vendor ON main_vendor.id = main_organization.vendor_id "
+                "WHERE main_campaign.organization_id = main_organization.id",
+                "UPDATE main_outlet SET owner_id = main_vendor.user_id "
+                "FROM main_organization JOIN main_vendor ON main_vendor.id = main_organization.vendor_id "
+                "WHERE main_outlet.organization_id = main_organization.id",
+                "UPDATE main_coupon SET owner_id = main_campaign.owner_id "
+                "FROM main_campaign WHERE main_coupon.campaign_id = main_campaign.id",
+            ],
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 2.0.5 on 2026-10-18 14:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_owner_not_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('coupon_id', models.IntegerField()),
+                ('campaign_id', models.IntegerField()),
+                ('consumer_id', models.IntegerField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('V', 'View'), ('S', 'Shortlist'), ('U', 'Use'), ('R', 'Rate')],
+                                          max_length=1)),
+                ('value', models.IntegerField(blank=True, null=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CouponStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('m', 'Minute'), ('h', 'Hour'), ('d', 'Day')],
+                                                 max_length=1)),
+                ('bucket', models.DateTimeField()),
+                ('views', models.IntegerField(default=0)),
+                ('shortlists', models.IntegerField(default=0)),
+                ('uses', models.IntegerField(default=0)),
+                ('ratings', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats',
+                                             related_query_name='stat', to='main.Coupon')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CampaignStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('m', 'Minute'), ('h', 'Hour'), ('d', 'Day')],
+                                                 max_length=1)),
+                ('bucket', models.DateTimeField()),
+                ('views', models.IntegerField(default=0)),
+                ('shortlists', models.IntegerField(default=0)),
+                ('uses', models.IntegerField(default=0)),
+                ('ratings', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats',
+                                               related_query_name='stat', to='main.Campaign')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='couponstat',
+            unique_together={('coupon', 'granularity', 'bucket')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='campaignstat',
+            unique_together={('campaign', 'granularity', 'bucket')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.0.5 on 2026-10-18 15:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='use',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='use',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterUniqueTogether(
+            name='use',
+            unique_together={('consumer', 'idempotency_key')},
+        ),
+    ]
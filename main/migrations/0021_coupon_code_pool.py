@@ -0,0 +1,48 @@
+# Generated by Django 2.0.5 on 2026-10-18 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_use_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='unique_codes',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='codes_left',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='use',
+            name='code',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CouponCode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=32)),
+                ('claimed', models.BooleanField(default=False)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codes',
+                                             related_query_name='pooled_code', to='main.Coupon')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='couponcode',
+            unique_together={('coupon', 'code')},
+        ),
+        # Claiming walks only the unclaimed part of the pool
+        migrations.RunSQL(
+            "CREATE INDEX couponcode_unclaimed_idx ON main_couponcode (coupon_id, id) WHERE NOT claimed",
+            "DROP INDEX couponcode_unclaimed_idx",
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.0.5 on 2026-10-18 18:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# A list, so the function body is not split at its semicolons
+LOG_CHANGE = [
+    """
+    CREATE FUNCTION main_coupon_log_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO main_couponchange (coupon_id, created) VALUES (OLD.id, now());
+        ELSE
+            INSERT INTO main_couponchange (coupon_id, created) VALUES (NEW.id, now());
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER coupon_log_insert_delete AFTER INSERT OR DELETE ON main_coupon
+        FOR EACH ROW EXECUTE PROCEDURE main_coupon_log_change()
+    """,
+    # Counter and owner updates don't change what clients see
+    """
+    CREATE TRIGGER coupon_log_update AFTER UPDATE ON main_coupon
+        FOR EACH ROW
+        WHEN (OLD.updated_at IS DISTINCT FROM NEW.updated_at OR OLD.published IS DISTINCT FROM NEW.published)
+        EXECUTE PROCEDURE main_coupon_log_change()
+    """,
+    "INSERT INTO main_couponchange (coupon_id, created) SELECT id, now() FROM main_coupon ORDER BY id",
+]
+
+DROP_LOG_CHANGE = [
+    "DROP TRIGGER coupon_log_update ON main_coupon",
+    "DROP TRIGGER coupon_log_insert_delete ON main_coupon",
+    "DROP FUNCTION main_coupon_log_change()",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CouponChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('coupon_id', models.IntegerField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='couponchange',
+            index=models.Index(fields=['coupon_id', 'id'], name='couponchange_coupon_id_idx'),
+        ),
+        migrations.RunSQL(LOG_CHANGE, DROP_LOG_CHANGE),
+    ]
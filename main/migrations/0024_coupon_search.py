@@ -0,0 +1,58 @@
+# Generated by Django 2.0.5 on 2026-10-18 19:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+from django.db.models import Max
+
+BATCH_SIZE = 10000
+
+SEARCH_VECTOR_SQL = """
+UPDATE main_coupon c SET search =
+    setweight(to_tsvector('english', c.name), 'A') ||
+    setweight(to_tsvector('english', o.name || ' ' || COALESCE((
+        SELECT string_agg(i.name, ' ') FROM main_coupon_interests ci JOIN main_interest i ON i.id = ci.interest_id
+        WHERE ci.coupon_id = c.id
+    ), '')), 'B') ||
+    setweight(to_tsvector('english', c.deal), 'C') ||
+    setweight(to_tsvector('english', c.description), 'D')
+FROM main_campaign ca JOIN main_organization o ON o.id = ca.organization_id
+WHERE ca.id = c.campaign_id AND c.id >= %s AND c.id < %s
+"""
+
+
+def fill_search_vectors(apps, schema_editor):
+    Coupon = apps.get_model('main', 'Coupon')
+    last = Coupon.objects.aggregate(last=Max('id'))['last'] or 0
+    with schema_editor.connection.cursor() as cursor:
+        # Committed batch by batch like 0015, an interrupted run can simply be restarted
+        for start in range(0, last + 1, BATCH_SIZE):
+            cursor.execute(SEARCH_VECTOR_SQL, [start, start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('main', '0023_coupon_change'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='coupon',
+            name='search',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='coupon',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search'], name='coupon_search_idx'),
+        ),
+        # Typo tolerant matching of names, GinIndex can't take an operator class here
+        migrations.RunSQL(
+            "CREATE INDEX coupon_name_trgm_idx ON main_coupon USING gin (name gin_trgm_ops)",
+            "DROP INDEX coupon_name_trgm_idx",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.5 on 2026-10-18 20:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_coupon_search'),
+    ]
+
+    operations = [
+        # Interest filter and facet lookups, answered from the index alone
+        migrations.RunSQL(
+            "CREATE INDEX coupon_interests_interest_coupon_idx ON main_coupon_interests (interest_id, coupon_id)",
+            "DROP INDEX coupon_interests_interest_coupon_idx",
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.0.5 on 2026-10-18 21:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0025_coupon_interests_index'),
+    ]
+
+    # One index per side of `active`, so the active and inactive tabs only read their part
+    # and "used" (end < now) is a bitmap OR of both ranges
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX coupon_active_end_idx ON main_coupon (published, "end") WHERE active',
+            "DROP INDEX coupon_active_end_idx",
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX coupon_inactive_end_idx ON main_coupon (published, "end") WHERE NOT active',
+            "DROP INDEX coupon_inactive_end_idx",
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX campaign_active_end_idx ON main_campaign ("end") WHERE active',
+            "DROP INDEX campaign_active_end_idx",
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX campaign_inactive_end_idx ON main_campaign ("end") WHERE NOT active',
+            "DROP INDEX campaign_inactive_end_idx",
+        ),
+    ]
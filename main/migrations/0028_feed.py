@@ -0,0 +1,53 @@
+# Generated by Django 2.0.5 on 2026-10-18 23:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0027_live'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='ratings',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            "UPDATE main_coupon c SET ratings = r.ratings, rating_sum = r.rating_sum "
+            "FROM (SELECT coupon_id, COUNT(*) AS ratings, SUM(rate) AS rating_sum FROM main_rate GROUP BY 1) r "
+            "WHERE r.coupon_id = c.id",
+            migrations.RunSQL.noop,
+        ),
+        migrations.CreateModel(
+            name='FeedCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('overlap', models.IntegerField()),
+                ('consumer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                                               to='main.Consumer')),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                                             to='main.Coupon')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='feedcandidate',
+            unique_together={('consumer', 'coupon')},
+        ),
+        migrations.RunSQL(
+            "INSERT INTO main_feedcandidate (consumer_id, coupon_id, overlap) "
+            "SELECT ci.consumer_id, ki.coupon_id, COUNT(*) FROM main_consumer_interests ci "
+            "JOIN main_coupon_interests ki ON ki.interest_id = ci.interest_id "
+            "JOIN main_coupon c ON c.id = ki.coupon_id "
+            "WHERE c.\"end\" >= now() GROUP BY 1, 2",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.0.5 on 2026-10-18 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0028_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consumer',
+            name='alerts',
+            field=models.BooleanField(blank=True, default=True),
+        ),
+        migrations.AddField(
+            model_name='consumer',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumer',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumer',
+            name='alert_radius',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='alerted',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        # Coupons already live before alerts existed are not news anymore, later ones still alert
+        migrations.RunSQL("UPDATE main_coupon SET alerted = true WHERE live", migrations.RunSQL.noop),
+        migrations.RunSQL(
+            "CREATE INDEX coupon_alert_pending_idx ON main_coupon (id) WHERE live AND NOT alerted",
+            "DROP INDEX coupon_alert_pending_idx",
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 2.0.5 on 2026-10-18 23:40
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0029_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='variants',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=dict, editable=False),
+        ),
+        # What `render_images` looks for, existing images included
+        migrations.RunSQL(
+            "CREATE INDEX coupon_variants_pending_idx ON main_coupon (id) "
+            "WHERE image IS DISTINCT FROM variants->>'source'",
+            "DROP INDEX coupon_variants_pending_idx",
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.0.5 on 2026-10-18 23:50
+
+from django.db import migrations, models
+import main.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0030_coupon_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='coupon',
+            name='image',
+            field=models.ImageField(storage=main.storage.ContentAddressedStorage(), upload_to='coupons/images/'),
+        ),
+        # Coupons sharing an image share its variants
+        migrations.RunSQL(
+            "CREATE INDEX coupon_variants_source_idx ON main_coupon ((variants -> 'source'))",
+            "DROP INDEX coupon_variants_source_idx",
+        ),
+    ]
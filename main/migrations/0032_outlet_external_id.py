@@ -0,0 +1,23 @@
+# Generated by Django 2.0.5 on 2026-10-19 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0031_coupon_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlet',
+            name='external_id',
+            field=models.TextField(blank=True, null=True),
+        ),
+        # Not unique_together, so serializers don't make external_id required. Imports upsert on it.
+        migrations.RunSQL(
+            "CREATE UNIQUE INDEX outlet_external_id_uniq ON main_outlet (organization_id, external_id)",
+            "DROP INDEX outlet_external_id_uniq",
+        ),
+    ]
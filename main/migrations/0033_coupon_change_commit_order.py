@@ -0,0 +1,77 @@
+# Generated by Django 2.0.5 on 2026-10-19 01:00
+
+from django.db import migrations
+
+# Key of the advisory lock serializing the log writes of committing transactions
+LOCK_KEY = 480023
+
+# The log is written by deferred constraint triggers, at commit, while holding a transaction lock
+# that is only released once the commit is visible. Change ids are therefore handed out in commit
+# order and a reader never sees a change with a higher id before a lower one.
+COMMIT_ORDER = [
+    "DROP TRIGGER coupon_log_update ON main_coupon",
+    "DROP TRIGGER coupon_log_insert_delete ON main_coupon",
+    """
+    CREATE OR REPLACE FUNCTION main_coupon_log_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_advisory_xact_lock(%d);
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO main_couponchange (coupon_id, created) VALUES (OLD.id, now());
+        ELSE
+            INSERT INTO main_couponchange (coupon_id, created) VALUES (NEW.id, now());
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """ % LOCK_KEY,
+    """
+    CREATE CONSTRAINT TRIGGER coupon_log_insert_delete AFTER INSERT OR DELETE ON main_coupon
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW EXECUTE PROCEDURE main_coupon_log_change()
+    """,
+    """
+    CREATE CONSTRAINT TRIGGER coupon_log_update AFTER UPDATE ON main_coupon
+        DEFERRABLE INITIALLY DEFERRED
+        FOR EACH ROW
+        WHEN (OLD.updated_at IS DISTINCT FROM NEW.updated_at OR OLD.published IS DISTINCT FROM NEW.published)
+        EXECUTE PROCEDURE main_coupon_log_change()
+    """,
+]
+
+START_ORDER = [
+    "DROP TRIGGER coupon_log_update ON main_coupon",
+    "DROP TRIGGER coupon_log_insert_delete ON main_coupon",
+    """
+    CREATE OR REPLACE FUNCTION main_coupon_log_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO main_couponchange (coupon_id, created) VALUES (OLD.id, now());
+        ELSE
+            INSERT INTO main_couponchange (coupon_id, created) VALUES (NEW.id, now());
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER coupon_log_insert_delete AFTER INSERT OR DELETE ON main_coupon
+        FOR EACH ROW EXECUTE PROCEDURE main_coupon_log_change()
+    """,
+    """
+    CREATE TRIGGER coupon_log_update AFTER UPDATE ON main_coupon
+        FOR EACH ROW
+        WHEN (OLD.updated_at IS DISTINCT FROM NEW.updated_at OR OLD.published IS DISTINCT FROM NEW.published)
+        EXECUTE PROCEDURE main_coupon_log_change()
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0032_outlet_external_id'),
+    ]
+
+    operations = [
+        migrations.RunSQL(COMMIT_ORDER, START_ORDER),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 2.0.5 on 2026-10-19 02:00
+
+from django.db import migrations, models
+
+SET_LIVE = """
+CREATE OR REPLACE FUNCTION main_coupon_set_live() RETURNS trigger AS $$
+BEGIN
+    NEW.live := NEW.active AND NEW.published AND NEW.start <= now() AND now() <= NEW."end";
+    -- Coupons going live are merged into the feeds sharing their interests by `refresh_feeds`
+    IF NEW.live AND (TG_OP = 'INSERT' OR NOT OLD.live) THEN
+        NEW.feed_pending := true;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+SET_LIVE_WITHOUT_FEED = """
+CREATE OR REPLACE FUNCTION main_coupon_set_live() RETURNS trigger AS $$
+BEGIN
+    NEW.live := NEW.active AND NEW.published AND NEW.start <= now() AND now() <= NEW."end";
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0033_coupon_change_commit_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consumer',
+            name='feed_refreshed',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='consumer',
+            name='feed_floor',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='coupon',
+            name='feed_pending',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='feedcandidate',
+            name='score',
+            field=models.FloatField(default=0),
+        ),
+        # Unbounded and unscored, every consumer is rebuilt by `refresh_feeds` as feed_refreshed is null
+        migrations.RunSQL("DELETE FROM main_feedcandidate", migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='feedcandidate',
+            index=models.Index(fields=['consumer', '-score', 'coupon'], name='feedcandidate_rank_idx'),
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX coupon_feed_pending_idx ON main_coupon (id) WHERE feed_pending",
+            "DROP INDEX coupon_feed_pending_idx",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX consumer_feed_refreshed_idx ON main_consumer (feed_refreshed NULLS FIRST, id)",
+            "DROP INDEX consumer_feed_refreshed_idx",
+        ),
+        migrations.RunSQL(SET_LIVE, SET_LIVE_WITHOUT_FEED),
+    ]
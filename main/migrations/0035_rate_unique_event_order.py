@@ -0,0 +1,64 @@
+# Generated by Django 2.0.5 on 2026-10-19 03:00
+
+from django.db import migrations, models
+
+# Key of the advisory lock, main.stats.EVENTS_LOCK_KEY
+LOCK_KEY = 480024
+
+# Keeps the latest rating of every consumer and coupon and recounts the coupons
+DEDUPLICATE_RATES = [
+    """
+    DELETE FROM main_rate r USING main_rate l
+    WHERE l.consumer_id = r.consumer_id AND l.coupon_id = r.coupon_id AND l.id > r.id
+    """,
+    """
+    UPDATE main_coupon c SET ratings = s.ratings, rating_sum = s.rating_sum
+    FROM (SELECT coupon_id, COUNT(*) AS ratings, SUM(rate) AS rating_sum FROM main_rate GROUP BY coupon_id) s
+    WHERE c.id = s.coupon_id AND (c.ratings, c.rating_sum) IS DISTINCT FROM (s.ratings, s.rating_sum)
+    """,
+]
+
+# Event inserts take the lock in shared mode before drawing their id and keep it until they end.
+# The rollup takes it exclusively to wait for them, afterwards every id drawn so far is settled.
+EVENT_ORDER = [
+    """
+    CREATE OR REPLACE FUNCTION main_couponevent_draw_id() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_advisory_xact_lock_shared(%d);
+        NEW.id := nextval(pg_get_serial_sequence('main_couponevent', 'id'));
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """ % LOCK_KEY,
+    """
+    CREATE TRIGGER couponevent_draw_id BEFORE INSERT ON main_couponevent
+        FOR EACH ROW EXECUTE PROCEDURE main_couponevent_draw_id()
+    """,
+]
+
+EVENT_ORDER_REVERSE = [
+    "DROP TRIGGER couponevent_draw_id ON main_couponevent",
+    "DROP FUNCTION main_couponevent_draw_id()",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0034_feed_top_n'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEDUPLICATE_RATES, migrations.RunSQL.noop),
+        migrations.AlterUniqueTogether(
+            name='rate',
+            unique_together={('consumer', 'coupon')},
+        ),
+        migrations.AlterField(
+            model_name='couponevent',
+            name='kind',
+            field=models.CharField(choices=[('V', 'View'), ('S', 'Shortlist'), ('U', 'Use'), ('R', 'Rate'),
+                                            ('C', 'Rating change')], max_length=1),
+        ),
+        migrations.RunSQL(EVENT_ORDER, EVENT_ORDER_REVERSE),
+    ]
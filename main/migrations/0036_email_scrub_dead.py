@@ -0,0 +1,19 @@
+# Generated by Django 2.0.5 on 2026-10-19 04:00
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0035_rate_unique_event_order'),
+    ]
+
+    operations = [
+        # Emails out of attempts are only kept for review, their context may hold a PIN
+        migrations.RunSQL(
+            [("UPDATE main_email SET context = '{}' WHERE attempts >= %s", [settings.EMAIL_OUTBOX_MAX_ATTEMPTS])],
+            migrations.RunSQL.noop,
+        ),
+    ]
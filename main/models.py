@@ -1,16 +1,27 @@
+import secrets
 from random import randint
 from urllib.parse import urlencode, quote_plus
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.gis.db.models import PointField
 from django.contrib.gis.geos import Point
 from django.core.mail import EmailMultiAlternatives
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
 from django.template.loader import get_template
+from django.utils import timezone
 from rest_framework import status
 from simple_email_confirmation.models import SimpleEmailConfirmationUserMixin
 
+from main.cache import invalidate_user, bump_reference_version
+from main.storage import coupon_storage
+
 
 class User(SimpleEmailConfirmationUserMixin, AbstractUser):
     ACCOUNT_TYPES = [
@@ -28,16 +39,13 @@ class User(SimpleEmailConfirmationUserMixin, AbstractUser):
         payload = {'email': self.email, 'code': self.get_confirmation_key()}
         result = urlencode(payload, quote_via=quote_plus)
         d = {'result': result, 'site_url': settings.SITE_URL}
-        subject, from_email, to = "Email verification", "no-reply@example.com", self.email
-        text_content = get_template("main/email/email-confirmation.txt").render(d)
-        html_content = get_template("main/email/email-confirmation.html").render(d)
-        msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
+        Email.objects.create(subject="Email verification", to=self.email, template="main/email/email-confirmation",
+                             context=d)
 
     def save(self, *args, **kwargs):
         created = self.pk is None
         super(User, self).save(*args, **kwargs)
+        invalidate_user(self.pk)
         if created:
             if self.atype == "V":
                 Vendor.objects.create(user=self)
@@ -47,12 +55,7 @@ class User(SimpleEmailConfirmationUserMixin, AbstractUser):
 
     def _send_pin_email(self, pin: str):
         d = {'username': self.username, 'pin': pin}
-        subject, from_email, to = "New PIN", "no-reply@example.com", self.email
-        text_content = get_template("main/email/new-pin.txt").render(d)
-        html_content = get_template("main/email/new-pin.html").render(d)
-        msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
+        Email.objects.create(subject="New PIN", to=self.email, template="main/email/new-pin", context=d)
 
     def _set_new_pin(self) -> str:
         pin = hex(randint(16 ** 4, 16 ** 5 - 1))[2:]
@@ -70,7 +73,21 @@ class User(SimpleEmailConfirmationUserMixin, AbstractUser):
         return self.username or ''
 
 
-class Consumer(models.Model):
+class ManagedFieldsMixin:
+    """
+    Leaves MANAGED_FIELDS, only changed by queryset updates and background jobs, out of full saves
+    of existing rows, so a stale instance can't overwrite them.
+    """
+    MANAGED_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None and not args and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.MANAGED_FIELDS]
+        super(ManagedFieldsMixin, self).save(*args, **kwargs)
+
+
+class Consumer(ManagedFieldsMixin, models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
     full_name = models.TextField(blank=True, null=True)
@@ -86,6 +103,24 @@ class Consumer(models.Model):
 
     interests = models.ManyToManyField('Interest', related_name="consumers", related_query_name="consumer")
 
+    # Hot offer emails for coupons sharing interests, only from outlets within alert_radius metres
+    # of latitude/longitude when all three are set
+    alerts = models.BooleanField(blank=True, default=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    alert_radius = models.IntegerField(blank=True, null=True)
+
+    # When the feed was last rebuilt, None once it has to be, and the score a coupon must reach
+    # to join a full feed before the next rebuild, see main.feed
+    feed_refreshed = models.DateTimeField(blank=True, null=True, editable=False)
+    feed_floor = models.FloatField(blank=True, null=True, editable=False)
+
+    MANAGED_FIELDS = ('feed_refreshed', 'feed_floor')
+
+    def save(self, *args, **kwargs):
+        super(Consumer, self).save(*args, **kwargs)
+        invalidate_user(self.user_id)
+
     def __str__(self):
         return self.full_name or ''
 
@@ -95,10 +130,46 @@ class Vendor(models.Model):
     verified = models.BooleanField(blank=True, default=False)
     restricted = models.BooleanField(blank=True, default=False)
 
+    def save(self, *args, **kwargs):
+        super(Vendor, self).save(*args, **kwargs)
+        invalidate_user(self.user_id)
+
     def __str__(self):
         return str(self.id) or ''
 
 
+def touch(queryset):
+    """
+    Bumps `updated_at` of rows whose representation changed without being saved,
+    e.g. a campaign listing a newly created coupon.
+    """
+    return queryset.update(updated_at=timezone.now())
+
+
+# Weighted search document of a coupon: its name, then organization and interests, then deal and description
+SEARCH_VECTOR_SQL = """
+UPDATE main_coupon c SET search =
+    setweight(to_tsvector(%s::regconfig, c.name), 'A') ||
+    setweight(to_tsvector(%s::regconfig, o.name || ' ' || COALESCE((
+        SELECT string_agg(i.name, ' ') FROM main_coupon_interests ci JOIN main_interest i ON i.id = ci.interest_id
+        WHERE ci.coupon_id = c.id
+    ), '')), 'B') ||
+    setweight(to_tsvector(%s::regconfig, c.deal), 'C') ||
+    setweight(to_tsvector(%s::regconfig, c.description), 'D')
+FROM main_campaign ca JOIN main_organization o ON o.id = ca.organization_id
+WHERE ca.id = c.campaign_id AND c.id IN ({coupons})
+"""
+
+
+def refresh_search_vectors(coupons):
+    """
+    Rebuilds the search vector of the coupons in the queryset.
+    """
+    sql, params = coupons.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_VECTOR_SQL.format(coupons=sql), [settings.SEARCH_CONFIG] * 4 + list(params))
+
+
 class Organization(models.Model):
     # If migrate to multiple organizations - change to ForeignKeyField
     vendor = models.OneToOneField(Vendor, on_delete=models.CASCADE, related_name="organization",
@@ -110,8 +181,21 @@ class Organization(models.Model):
     verified = models.BooleanField(blank=True, default=False)
     reviewed = models.BooleanField(blank=True, default=False)
 
-    def get_owner(self):
-        return self.vendor.user
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_owner_id(self):
+        return self.vendor.user_id
+
+    def save(self, *args, **kwargs):
+        renamed = self.pk is not None and not Organization.objects.filter(pk=self.pk, name=self.name).exists()
+        super(Organization, self).save(*args, **kwargs)
+        if renamed:
+            refresh_search_vectors(Coupon.objects.filter(campaign__organization=self))
+        # Denormalized owners follow the organization if it is handed to another vendor
+        owner_id = self.get_owner_id()
+        Campaign.objects.filter(organization=self).exclude(owner_id=owner_id).update(owner_id=owner_id)
+        Outlet.objects.filter(organization=self).exclude(owner_id=owner_id).update(owner_id=owner_id)
+        Coupon.objects.filter(campaign__organization=self).exclude(owner_id=owner_id).update(owner_id=owner_id)
 
     def __str__(self):
         return self.name or ''
@@ -127,9 +211,35 @@ class Campaign(models.Model):
     end = models.DateTimeField()
 
     active = models.BooleanField(default=False)
+    # active and start <= now <= end, kept by a database trigger on writes and by `sweep_lifecycle`
+    # as time passes. Not refreshed on the instance after save.
+    live = models.BooleanField(default=False, editable=False)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Denormalized organization.vendor.user, so ownership checks don't walk the relations
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+", editable=False)
 
-    def get_owner(self):
-        return self.organization.get_owner()
+    class Meta:
+        indexes = [
+            models.Index(fields=['start', 'id'], name='campaign_start_id_idx'),
+        ]
+
+    def get_owner_id(self):
+        return self.owner_id
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        self.owner_id = self.organization.get_owner_id()
+        super(Campaign, self).save(*args, **kwargs)
+        self.coupons.exclude(owner_id=self.owner_id).update(owner_id=self.owner_id)
+        if created:
+            touch(Organization.objects.filter(pk=self.organization_id))
+
+    def delete(self, *args, **kwargs):
+        result = super(Campaign, self).delete(*args, **kwargs)
+        touch(Organization.objects.filter(pk=self.organization_id))
+        return result
 
     def __str__(self):
         return self.name or ''
@@ -146,20 +256,43 @@ class Outlet(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
 
-    geom = PointField(blank=True)
+    # Always derived from longitude/latitude, a check constraint keeps them in sync
+    geom = PointField(blank=True, spatial_index=False)
+
+    # The vendor's own store id, unique per organization, imports update outlets by it
+    external_id = models.TextField(blank=True, null=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
 
-    def get_owner(self):
-        return self.organization.get_owner()
+    # Denormalized organization.vendor.user
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+", editable=False)
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=['geom'], name='outlet_geom_gist_idx'),
+        ]
+
+    def get_owner_id(self):
+        return self.owner_id
 
     def save(self, *args, **kwargs):
-        self.geom = Point(self.latitude, self.longitude)
+        self.geom = Point(self.longitude, self.latitude, srid=4326)
+        created = self.pk is None
+        self.owner_id = self.organization.get_owner_id()
         super(Outlet, self).save(*args, **kwargs)
+        if created:
+            touch(Organization.objects.filter(pk=self.organization_id))
+
+    def delete(self, *args, **kwargs):
+        result = super(Outlet, self).delete(*args, **kwargs)
+        touch(Organization.objects.filter(pk=self.organization_id))
+        return result
 
     def __str__(self):
         return self.name or ''
 
 
-class Coupon(models.Model):
+class Coupon(ManagedFieldsMixin, models.Model):
     ctype = models.ForeignKey('Type', on_delete=models.CASCADE, related_name="coupons",
                               related_query_name="coupon")
     category = models.ForeignKey('Category', on_delete=models.CASCADE, related_name="coupons",
@@ -171,11 +304,17 @@ class Coupon(models.Model):
     name = models.TextField()
     description = models.TextField()
     deal = models.TextField()
-    image = models.ImageField(upload_to='coupons/images/')
+    image = models.ImageField(upload_to='coupons/images/', storage=coupon_storage)
 
     TC = models.TextField()
     amount = models.IntegerField()
     code = models.TextField()
+    # Every redemption gets its own code from the pool instead of the shared one
+    unique_codes = models.BooleanField(default=False, editable=False)
+    codes_left = models.IntegerField(default=0, editable=False)
+    # Totals of Rate rows, for ranking without aggregating them
+    ratings = models.IntegerField(default=0, editable=False)
+    rating_sum = models.IntegerField(default=0, editable=False)
 
     start = models.DateTimeField()
     end = models.DateTimeField()
@@ -183,11 +322,103 @@ class Coupon(models.Model):
     advertisement = models.BooleanField(blank=True, default=True)
     active = models.BooleanField(blank=True, default=True)
     published = models.BooleanField(blank=True, default=False)
+    # active and published and start <= now <= end, maintained like Campaign.live
+    live = models.BooleanField(default=False, editable=False)
+    # Set once hot offer alerts went out, see main.alerts
+    alerted = models.BooleanField(default=False, editable=False)
+    # Set when the coupon goes live or its interests change, until `refresh_feeds` redid its feed candidates
+    feed_pending = models.BooleanField(default=False, editable=False)
 
     interests = models.ManyToManyField('Interest', related_name="coupons", related_query_name="coupon")
 
-    def get_owner(self):
-        return self.campaign.get_owner()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Maintained by refresh_search_vectors, includes the organization and interest names
+    search = SearchVectorField(blank=True, null=True, editable=False)
+    # Resized copies of `image` rendered by main.images, stale while `source` differs from `image`
+    variants = JSONField(default=dict, editable=False)
+
+    # Denormalized campaign.owner
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+", editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start', 'id'], name='coupon_start_id_idx'),
+            GinIndex(fields=['search'], name='coupon_search_idx'),
+        ]
+
+    MANAGED_FIELDS = ('unique_codes', 'codes_left', 'ratings', 'rating_sum', 'alerted', 'feed_pending', 'variants')
+
+    def get_owner_id(self):
+        return self.owner_id
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        self.owner_id = self.campaign.owner_id
+        super(Coupon, self).save(*args, **kwargs)
+        if created:
+            touch(Campaign.objects.filter(pk=self.campaign_id))
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'name', 'deal', 'description', 'campaign'} & set(update_fields):
+            refresh_search_vectors(Coupon.objects.filter(pk=self.pk))
+
+    def delete(self, *args, **kwargs):
+        outlets = list(self.outlets.values_list('id', flat=True))
+        result = super(Coupon, self).delete(*args, **kwargs)
+        touch(Campaign.objects.filter(pk=self.campaign_id))
+        touch(Outlet.objects.filter(pk__in=outlets))
+        return result
+
+    def is_available(self):
+        now = timezone.now()
+        return self.active and self.published and self.start <= now <= self.end
+
+    def redeem(self, consumer, idempotency_key: str = None):
+        """
+        Takes one coupon out of stock with a single conditional UPDATE, so parallel redemptions can't oversell.
+        Returns the new Use or None if the coupon is out of stock or not available.
+        """
+        now = timezone.now()
+        stock = Coupon.objects.filter(pk=self.pk, amount__gt=0, active=True, published=True,
+                                      start__lte=now, end__gte=now)
+        # Stock is not synced, so redemptions leave updated_at and the change log alone
+        changes = {'amount': F('amount') - 1}
+        if self.unique_codes:
+            stock = stock.filter(codes_left__gt=0)
+            changes['codes_left'] = F('codes_left') - 1
+        with transaction.atomic():
+            if not stock.update(**changes):
+                return None
+            code = self.code
+            if self.unique_codes:
+                pooled = CouponCode.objects.select_for_update(skip_locked=True) \
+                    .filter(coupon_id=self.pk, claimed=False).order_by('id').first()
+                if pooled is None:
+                    transaction.set_rollback(True)
+                    return None
+                CouponCode.objects.filter(pk=pooled.pk).update(claimed=True)
+                code = pooled.code
+            return Use.objects.create(consumer=consumer, coupon=self, code=code, idempotency_key=idempotency_key)
+
+    def generate_codes(self, count: int):
+        """
+        Adds `count` random codes to the pool, inserted in batches of CODE_POOL_BATCH_SIZE.
+        A batch colliding with an existing code is regenerated.
+        """
+        left = count
+        while left:
+            size = min(left, settings.CODE_POOL_BATCH_SIZE)
+            codes = set()
+            while len(codes) < size:
+                codes.add(''.join(secrets.choice(CouponCode.ALPHABET) for _ in range(CouponCode.LENGTH)))
+            try:
+                with transaction.atomic():
+                    CouponCode.objects.bulk_create([CouponCode(coupon_id=self.pk, code=code) for code in codes])
+                    Coupon.objects.filter(pk=self.pk).update(codes_left=F('codes_left') + size, unique_codes=True)
+            except IntegrityError:
+                continue
+            left -= size
+        self.refresh_from_db(fields=['unique_codes', 'codes_left'])
 
     def __str__(self):
         return self.name or ''
@@ -197,11 +428,37 @@ class Type(models.Model):
     name = models.TextField()
     description = models.TextField()
 
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super(Type, self).save(*args, **kwargs)
+        bump_reference_version(self._meta.model_name)
+        if not created:
+            # Coupons are served with their type nested
+            touch(self.coupons.all())
+
+    def delete(self, *args, **kwargs):
+        result = super(Type, self).delete(*args, **kwargs)
+        bump_reference_version(self._meta.model_name)
+        return result
+
 
 class Category(models.Model):
     name = models.TextField()
     description = models.TextField()
 
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super(Category, self).save(*args, **kwargs)
+        bump_reference_version(self._meta.model_name)
+        if not created:
+            # Coupons are served with their category nested
+            touch(self.coupons.all())
+
+    def delete(self, *args, **kwargs):
+        result = super(Category, self).delete(*args, **kwargs)
+        bump_reference_version(self._meta.model_name)
+        return result
+
 
 class Rate(models.Model):
     consumer = models.ForeignKey(Consumer, on_delete=models.CASCADE)
@@ -209,18 +466,278 @@ class Rate(models.Model):
     rate = models.IntegerField()
     review = models.TextField(blank=True, null=True)
 
+    class Meta:
+        unique_together = ('consumer', 'coupon')
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = Rate.objects.select_for_update().filter(pk=self.pk).values_list('rate', flat=True).first()
+            super(Rate, self).save(*args, **kwargs)
+            if previous is None:
+                Coupon.objects.filter(pk=self.coupon_id).update(ratings=F('ratings') + 1,
+                                                                rating_sum=F('rating_sum') + self.rate)
+                CouponEvent.record(self.coupon, CouponEvent.RATE, self.consumer_id, self.rate)
+            elif previous != self.rate:
+                # A changed rating only moves the sum by the difference
+                Coupon.objects.filter(pk=self.coupon_id).update(rating_sum=F('rating_sum') + self.rate - previous)
+                CouponEvent.record(self.coupon, CouponEvent.RERATE, self.consumer_id, self.rate - previous)
+
 
 class ShortList(models.Model):
     consumer = models.ForeignKey(Consumer, on_delete=models.CASCADE)
     coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE)
     active = models.BooleanField(blank=True, default=True)
 
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super(ShortList, self).save(*args, **kwargs)
+        if created:
+            CouponEvent.record(self.coupon, CouponEvent.SHORTLIST, self.consumer_id)
+
 
 class Use(models.Model):
     consumer = models.ForeignKey(Consumer, on_delete=models.CASCADE)
     coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE)
+    # Client supplied, retries with the same key return the first redemption
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True)
+    created = models.DateTimeField(default=timezone.now)
+    # Code given to the consumer, either the shared Coupon.code or one from the pool
+    code = models.TextField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('consumer', 'idempotency_key')
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super(Use, self).save(*args, **kwargs)
+        if created:
+            CouponEvent.record(self.coupon, CouponEvent.USE, self.consumer_id)
+
+
+class CouponCode(models.Model):
+    # No 0/O and 1/I to keep codes readable
+    ALPHABET = "23456789ABCDEFGHJKLMNPQRSTUVWXYZ"
+    LENGTH = 12
+
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name="codes", related_query_name="pooled_code")
+    code = models.CharField(max_length=32)
+    # Unclaimed codes are covered by a partial index on (coupon_id, id), see migration 0021
+    claimed = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('coupon', 'code')
+
+
+class FeedCandidate(models.Model):
+    """
+    The best live coupons sharing interests with a consumer, at most FEED_SIZE of them with their score.
+    Kept by `refresh_feeds` in the background, the request path only queues consumers and coupons for it.
+    """
+    consumer = models.ForeignKey(Consumer, on_delete=models.CASCADE, related_name="+")
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name="+")
+    overlap = models.IntegerField()
+    score = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('consumer', 'coupon')
+        indexes = [
+            models.Index(fields=['consumer', '-score', 'coupon'], name='feedcandidate_rank_idx'),
+        ]
+
+    @classmethod
+    def queue_consumers(cls, consumer_ids):
+        Consumer.objects.filter(pk__in=list(consumer_ids)).update(feed_refreshed=None)
+
+    @classmethod
+    def queue_coupons(cls, coupon_ids):
+        Coupon.objects.filter(pk__in=list(coupon_ids)).update(feed_pending=True)
+
+
+class CouponEvent(models.Model):
+    """
+    Append-only stream of consumer activity, rolled up into CouponStat and CampaignStat by `rollup_stats`.
+    Never read by the API directly. Ids are drawn under a shared advisory lock held until commit,
+    see migration 0035, so the rollup can wait for every id below its watermark to settle.
+    """
+    VIEW, SHORTLIST, USE, RATE, RERATE = "V", "S", "U", "R", "C"
+    KINDS = [
+        (VIEW, "View"),
+        (SHORTLIST, "Shortlist"),
+        (USE, "Use"),
+        (RATE, "Rate"),
+        # Value is the difference to the consumer's previous rating
+        (RERATE, "Rating change"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    # Plain ids instead of foreign keys, so inserts don't lock the referenced rows
+    coupon_id = models.IntegerField()
+    campaign_id = models.IntegerField()
+    consumer_id = models.IntegerField(blank=True, null=True)
+
+    kind = models.CharField(max_length=1, choices=KINDS)
+    value = models.IntegerField(blank=True, null=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def record(cls, coupon, kind: str, consumer_id: int = None, value: int = None):
+        return cls.objects.create(coupon_id=coupon.id, campaign_id=coupon.campaign_id, consumer_id=consumer_id,
+                                  kind=kind, value=value)
+
+
+class CouponChange(models.Model):
+    """
+    Log of coupon changes, filled by a database trigger on every insert, delete and update
+    that touches `updated_at` or `published`, so queryset updates are logged too.
+    Rows are written at commit, their ids follow the commit order.
+    Read by the sync feed, superseded rows are removed by `compact_changes`.
+    """
+    id = models.BigAutoField(primary_key=True)
+    # Plain id, the row outlives the coupon as its tombstone
+    coupon_id = models.IntegerField()
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['coupon_id', 'id'], name='couponchange_coupon_id_idx'),
+        ]
+
+
+class StatCounters(models.Model):
+    MINUTE, HOUR, DAY = "m", "h", "d"
+    GRANULARITIES = [
+        (MINUTE, "Minute"),
+        (HOUR, "Hour"),
+        (DAY, "Day"),
+    ]
+
+    granularity = models.CharField(max_length=1, choices=GRANULARITIES)
+    bucket = models.DateTimeField()
+
+    views = models.IntegerField(default=0)
+    shortlists = models.IntegerField(default=0)
+    uses = models.IntegerField(default=0)
+    ratings = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class CouponStat(StatCounters):
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name="stats", related_query_name="stat")
+
+    class Meta:
+        unique_together = ('coupon', 'granularity', 'bucket')
+
+
+class CampaignStat(StatCounters):
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="stats",
+                                 related_query_name="stat")
+
+    class Meta:
+        unique_together = ('campaign', 'granularity', 'bucket')
+
+
+class Watermark(models.Model):
+    """Position of a background job in an append-only table."""
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.BigIntegerField(default=0)
 
 
 class Interest(models.Model):
     name = models.TextField()
     description = models.TextField()
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        renamed = not created and not Interest.objects.filter(pk=self.pk, name=self.name).exists()
+        super(Interest, self).save(*args, **kwargs)
+        bump_reference_version(self._meta.model_name)
+        if not created:
+            # Coupons are served with their interests nested
+            touch(self.coupons.all())
+        if renamed:
+            refresh_search_vectors(self.coupons.all())
+
+    def delete(self, *args, **kwargs):
+        coupons = list(self.coupons.values_list('id', flat=True))
+        result = super(Interest, self).delete(*args, **kwargs)
+        bump_reference_version(self._meta.model_name)
+        touch(Coupon.objects.filter(pk__in=coupons))
+        refresh_search_vectors(Coupon.objects.filter(pk__in=coupons))
+        return result
+
+
+class Email(models.Model):
+    """
+    Outbox of emails waiting to be delivered by the `send_emails` worker.
+    Templates are rendered by the worker, rows are removed once sent. Rows out of attempts
+    are kept for review with their context emptied, so no PIN outlives its delivery.
+    """
+    FROM_EMAIL = "no-reply@example.com"
+
+    subject = models.TextField()
+    to = models.EmailField()
+    # Template name without extension, both .txt and .html versions are rendered
+    template = models.TextField()
+    context = JSONField(default=dict)
+
+    created = models.DateTimeField(auto_now_add=True)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+
+    def to_message(self, connection=None) -> EmailMultiAlternatives:
+        text_content = get_template("{}.txt".format(self.template)).render(self.context)
+        html_content = get_template("{}.html".format(self.template)).render(self.context)
+        msg = EmailMultiAlternatives(self.subject, text_content, self.FROM_EMAIL, [self.to], connection=connection)
+        msg.attach_alternative(html_content, "text/html")
+        return msg
+
+    def __str__(self):
+        return "{} to {}".format(self.subject, self.to)
+
+
+@receiver(m2m_changed, sender=Coupon.interests.through)
+def touch_coupon_interests(sender, instance, action, reverse, pk_set, **kwargs):
+    # Interest names are part of the search document, so it is rebuilt once the links are in place
+    if action == 'pre_clear':
+        instance._cleared_coupons = list(instance.coupons.values_list('id', flat=True)) if reverse else [instance.pk]
+        return
+    if action == 'post_clear':
+        coupon_ids = instance._cleared_coupons
+    elif action in ('post_add', 'post_remove'):
+        coupon_ids = pk_set if reverse else [instance.pk]
+    else:
+        return
+    coupons = Coupon.objects.filter(pk__in=coupon_ids)
+    touch(coupons)
+    refresh_search_vectors(coupons)
+    FeedCandidate.queue_coupons(coupon_ids)
+
+
+@receiver(m2m_changed, sender=Consumer.interests.through)
+def refresh_consumer_feed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_consumers = list(instance.consumers.values_list('id', flat=True)) if reverse \
+            else [instance.pk]
+    elif action == 'post_clear':
+        FeedCandidate.queue_consumers(instance._cleared_consumers)
+    elif action in ('post_add', 'post_remove'):
+        FeedCandidate.queue_consumers(pk_set if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=Coupon.outlets.through)
+def touch_coupon_outlets(sender, instance, action, reverse, pk_set, **kwargs):
+    # Both sides list each other, so both are modified whenever the link changes
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        outlets, coupons = [instance.pk], pk_set if pk_set is not None else instance.coupons.values('id')
+    else:
+        outlets, coupons = pk_set if pk_set is not None else instance.outlets.values('id'), [instance.pk]
+    touch(Outlet.objects.filter(pk__in=outlets))
+    touch(Coupon.objects.filter(pk__in=coupons))
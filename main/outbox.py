@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from main.models import Email
+
+
+def send_queued_emails(batch_size: int = None) -> int:
+    """
+    Sends one batch of due emails over a single connection and returns the number of processed rows.
+    The batch is claimed in a short transaction with SKIP LOCKED, by moving its next attempt
+    EMAIL_OUTBOX_CLAIM_TIMEOUT seconds ahead, and sent after the commit, so no lock is held over SMTP.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(Email.objects.select_for_update(skip_locked=True)
+                      .filter(next_attempt__lte=now, attempts__lt=settings.EMAIL_OUTBOX_MAX_ATTEMPTS)
+                      .order_by('next_attempt')[:batch_size])
+        if not emails:
+            return 0
+        Email.objects.filter(id__in=[email.id for email in emails]) \
+            .update(next_attempt=now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT))
+    sent = []
+    with get_connection() as connection:
+        for email in emails:
+            try:
+                email.to_message(connection).send()
+                sent.append(email.id)
+            except Exception as e:
+                # Exponential backoff, emails exceeding EMAIL_OUTBOX_MAX_ATTEMPTS stay in the table for review
+                email.attempts += 1
+                email.next_attempt = timezone.now() + timedelta(
+                    seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1))
+                email.last_error = str(e)
+                fields = ['attempts', 'next_attempt', 'last_error']
+                if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+                    # Without the context, it may hold a PIN
+                    email.context = {}
+                    fields.append('context')
+                email.save(update_fields=fields)
+    Email.objects.filter(id__in=sent).delete()
+    return len(emails)
@@ -0,0 +1,86 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class IdCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class KeysetCursorPagination(IdCursorPagination):
+    """
+    Cursor pagination on a composite ordering ending in a unique field. DRF only seeks on the first
+    field and skips the rows sharing its value with an offset, which grows with every coupon starting
+    at the same time. Here the cursor holds the whole key and a page starts right after it.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = None if self.cursor is None else self.cursor.position
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        try:
+            if position is not None:
+                queryset = queryset.filter(self.get_keyset_filter(ordering, position))
+            results = list(queryset[:self.page_size + 1])
+        except (ValidationError, ValueError):
+            # A position that isn't made of values of the ordering fields
+            raise NotFound(self.invalid_cursor_message)
+        self.page = results[:self.page_size]
+
+        # Positions are unique, so the links never need an offset
+        following = None
+        if len(results) > len(self.page):
+            following = self._get_position_from_instance(results[-1], self.ordering)
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next, self.next_position = position is not None, position
+            self.has_previous, self.previous_position = following is not None, following
+        else:
+            self.has_next, self.next_position = following is not None, following
+            self.has_previous, self.previous_position = position is not None, position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_keyset_filter(self, ordering, position) -> Q:
+        """Rows after `position` in `ordering`, bounded on the first field so an index scan can start there."""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        fields = [(field.lstrip('-'), 'lt' if field.startswith('-') else 'gt') for field in ordering]
+        after = None
+        for (name, lookup), value in reversed(list(zip(fields, values))):
+            beyond = Q(**{"{}__{}".format(name, lookup): value})
+            after = beyond if after is None else beyond | Q(**{name: value}) & after
+        name, lookup = fields[0]
+        return Q(**{"{}__{}e".format(name, lookup): values[0]}) & after
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps([str(getattr(instance, field.lstrip('-'))) for field in ordering])
+
+
+class CouponCursorPagination(KeysetCursorPagination):
+    ordering = ('start', 'id')
+
+
+class CampaignCursorPagination(KeysetCursorPagination):
+    ordering = ('start', 'id')
@@ -0,0 +1,27 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def iter_ndjson(stream, encoding: str = None):
+    """Yields the objects of a newline delimited JSON stream one line at a time, blank lines are skipped."""
+    encoding = encoding or settings.DEFAULT_CHARSET
+    for number, line in enumerate(iter(stream.readline, b''), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line.decode(encoding))
+        except ValueError as e:
+            raise ParseError("NDJSON parse error on line {} - {}".format(number, e))
+
+
+class NDJSONParser(BaseParser):
+    """Newline delimited JSON, parsed into a list of its lines."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        return list(iter_ndjson(stream, parser_context.get('encoding')))
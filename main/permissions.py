@@ -24,7 +24,14 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         # Creating is allowed too
         if request.method == "POST":
             return True
-        return obj.get_owner() == request.user or request.user.is_superuser
+        return obj.get_owner_id() == request.user.id or request.user.is_superuser
+
+
+class IsOwner(permissions.BasePermission):
+    message = "Access denied"
+
+    def has_object_permission(self, request, view, obj):
+        return obj.get_owner_id() == request.user.id or request.user.is_superuser
 
 
 class IsEmailVerifiedOrReadOnly(permissions.BasePermission):
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+
+def search_coupons(queryset, q: str):
+    """
+    Coupons matching `q` by full text or, for typos, by trigram similarity of the name,
+    annotated with `rank`. Both conditions are served by GIN indexes.
+    """
+    query = SearchQuery(q, config=settings.SEARCH_CONFIG)
+    # Cast to double precision, so the rank survives a round trip through a pagination cursor
+    rank = Cast(SearchRank(F('search'), query) + TrigramSimilarity('name', q), FloatField())
+    return queryset.filter(Q(search=query) | Q(name__trigram_similar=q)).annotate(rank=rank)
@@ -1,12 +1,21 @@
+import os
 import re
+from urllib.parse import urlparse
 
+from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate
 from django.core.validators import RegexValidator
+from django.db.models import Q
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from rest_framework_jwt.serializers import JSONWebTokenSerializer, jwt_payload_handler, jwt_encode_handler
 
-from main.models import Consumer, Organization, Campaign, Outlet, Coupon, Vendor, Type, Category, Interest
+from main.models import Consumer, Organization, Campaign, Outlet, Coupon, Vendor, Type, Category, Interest, Rate, \
+    CampaignStat, StatCounters, Use
+from main.stats import BUCKET_LENGTHS
+from main.storage import BLOB_NAME
+from main.uploads import StreamedImage
 
 
 class CustomJWTSerializer(JSONWebTokenSerializer):
@@ -92,9 +101,14 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class ConsumerSerializer(serializers.ModelSerializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90, allow_null=True, required=False)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, allow_null=True, required=False)
+    alert_radius = serializers.IntegerField(min_value=1, max_value=settings.NEARBY_MAX_RADIUS, allow_null=True,
+                                            required=False)
+
     class Meta:
         model = Consumer
-        fields = ['full_name', 'birth_date']
+        fields = ['full_name', 'birth_date', 'interests', 'alerts', 'latitude', 'longitude', 'alert_radius']
 
 
 class OrganizationSerializer(serializers.ModelSerializer):
@@ -135,9 +149,10 @@ class VendorSerializer(serializers.ModelSerializer):
 
 class CampaignSerializer(serializers.ModelSerializer):
     coupons = serializers.PrimaryKeyRelatedField(read_only=True, many=True)
+    organization = serializers.PrimaryKeyRelatedField(queryset=Organization.objects.select_related('vendor'))
 
     def validate_organization(self, organization):
-        if organization.get_owner() != self.context["request"].user:
+        if organization.get_owner_id() != self.context["request"].user.id:
             raise serializers.ValidationError("You must be an owner of this organization")
         if not organization.verified:
             raise serializers.ValidationError("Organization must be verified!")
@@ -150,28 +165,75 @@ class CampaignSerializer(serializers.ModelSerializer):
 
 class OutletSerializer(serializers.ModelSerializer):
     coupons = serializers.PrimaryKeyRelatedField(read_only=True, many=True)
+    organization = serializers.PrimaryKeyRelatedField(queryset=Organization.objects.select_related('vendor'))
 
     def validate_organization(self, organization):
-        if organization.get_owner() != self.context["request"].user:
+        if organization.get_owner_id() != self.context["request"].user.id:
             raise serializers.ValidationError("You must be an owner of this organization")
         if not organization.verified:
             raise serializers.ValidationError("Organization must be verified!")
         return organization
 
+    def validate(self, attrs):
+        organization = attrs.get("organization", getattr(self.instance, "organization", None))
+        external_id = attrs.get("external_id")
+        if external_id and Outlet.objects.filter(organization=organization, external_id=external_id) \
+                .exclude(pk=getattr(self.instance, "pk", None)).exists():
+            raise serializers.ValidationError({"external_id": ["Organization already has an outlet with this id"]})
+        return attrs
+
     class Meta:
         model = Outlet
-        fields = ["id", "name", "description", "address", "latitude", "longitude", "organization", "coupons"]
+        fields = ["id", "name", "description", "address", "latitude", "longitude", "external_id", "organization",
+                  "coupons"]
+
+
+class OutletImportQuerySerializer(serializers.Serializer):
+    organization = serializers.PrimaryKeyRelatedField(queryset=Organization.objects.select_related('vendor'))
+    # Rows with the external_id of an existing outlet update it instead of being skipped
+    upsert = serializers.BooleanField(default=False)
+
+    def validate_organization(self, organization):
+        if organization.get_owner_id() != self.context["request"].user.id:
+            raise serializers.ValidationError("You must be an owner of this organization")
+        if not organization.verified:
+            raise serializers.ValidationError("Organization must be verified!")
+        return organization
+
+
+class OutletRowSerializer(serializers.Serializer):
+    """One row of an outlet import, see main.bulk.import_outlets."""
+    external_id = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    name = serializers.CharField()
+    description = serializers.CharField()
+    address = serializers.CharField()
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+
+    def validate_external_id(self, external_id):
+        return external_id or None
+
+
+class StreamedImageField(serializers.ImageField):
+    """ImageField that trusts the checks of StreamingImageUploadHandler instead of reading the file again."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, StreamedImage):
+            return serializers.FileField.to_internal_value(self, data)
+        return super(StreamedImageField, self).to_internal_value(data)
 
 
 class CouponSerializer(serializers.ModelSerializer):
+    image = StreamedImageField()
+
     def validate_campaign(self, campaign):
-        if campaign.get_owner() != self.context["request"].user:
+        if campaign.get_owner_id() != self.context["request"].user.id:
             raise serializers.ValidationError("You must be an owner of this campaign")
         return campaign
 
     def validate_outlets(self, outlets):
         for outlet in outlets:
-            if outlet.get_owner() != self.context["request"].user:
+            if outlet.get_owner_id() != self.context["request"].user.id:
                 raise serializers.ValidationError("You must be an owner of this outlet")
         return outlets
 
@@ -181,6 +243,40 @@ class CouponSerializer(serializers.ModelSerializer):
                   "code", "start", "end", "interests", "outlets", "active", "published", "advertisement"]
 
 
+class BulkCouponSerializer(serializers.ModelSerializer):
+    """
+    One item of /api/coupons/bulk, a new coupon or, with an `id`, changes to an existing one.
+    Relations are plain ids, checked for the whole batch by main.bulk. The image is the url
+    or name of an image uploaded before, so the same banner is shared by many coupons.
+    """
+    id = serializers.IntegerField(required=False)
+    ctype = serializers.IntegerField(source='ctype_id')
+    category = serializers.IntegerField(source='category_id')
+    campaign = serializers.IntegerField(source='campaign_id')
+    image = serializers.CharField()
+    interests = serializers.ListField(child=serializers.IntegerField(), required=False)
+    outlets = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Coupon
+        fields = CouponSerializer.Meta.fields
+
+    def validate_image(self, image):
+        path = urlparse(image).path
+        if path.startswith(settings.MEDIA_URL):
+            path = path[len(settings.MEDIA_URL):]
+        field = Coupon._meta.get_field('image')
+        directory = os.path.dirname(field.generate_filename(None, 'image'))
+        if os.path.dirname(os.path.dirname(path)) != directory or not BLOB_NAME.search(path):
+            raise serializers.ValidationError("Not an uploaded coupon image")
+        try:
+            # A fresh mtime keeps `collect_blobs` off it until the batch referencing it is committed
+            os.utime(field.storage.path(path))
+        except FileNotFoundError:
+            raise serializers.ValidationError("Not an uploaded coupon image")
+        return path
+
+
 class TypeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Type
@@ -203,16 +299,132 @@ class RetrieveCouponSerializer(serializers.ModelSerializer):
     interests = InterestSerializer(read_only=True, many=True)
     ctype = TypeSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Coupon
-        fields = ["id", "ctype", "category", "campaign", "name", "description", "deal", "image", "TC", "amount",
-                  "code", "start", "end", "interests", "outlets", "active", "published", "advertisement"]
+        fields = ["id", "ctype", "category", "campaign", "name", "description", "deal", "image", "image_variants",
+                  "TC", "amount", "code", "start", "end", "interests", "outlets", "active", "published",
+                  "advertisement"]
+
+    def get_image_variants(self, coupon: Coupon) -> dict:
+        """Size -> format -> url, empty until the variants of the current image are rendered."""
+        if coupon.variants.get('source') != coupon.image.name:
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for size, formats in coupon.variants['sizes'].items():
+            urls[size] = {}
+            for extension, name in formats.items():
+                url = coupon.image.storage.url(name)
+                urls[size][extension] = request.build_absolute_uri(url) if request else url
+        return urls
 
     def validate(self, *args, **kwargs):
         raise serializers.ValidationError("This serializer is only for Reading!")
 
 
+class NearbyCouponSerializer(RetrieveCouponSerializer):
+    distance = serializers.FloatField(source='distance.m', read_only=True)
+
+    class Meta(RetrieveCouponSerializer.Meta):
+        fields = RetrieveCouponSerializer.Meta.fields + ["distance"]
+
+
+class LifecycleFilterSerializer(serializers.Serializer):
+    """
+    `state` filter of coupon and campaign lists: active, inactive or used (already ended).
+    Validated with partial=True so only the given filters apply.
+    """
+    ACTIVE, INACTIVE, USED = "active", "inactive", "used"
+
+    state = serializers.ChoiceField(choices=[ACTIVE, INACTIVE, USED])
+
+    def get_state_filter(self) -> Q:
+        return {
+            self.ACTIVE: Q(active=True),
+            self.INACTIVE: Q(active=False),
+            self.USED: Q(end__lt=timezone.now()),
+        }[self.validated_data["state"]]
+
+
+class CouponFilterSerializer(LifecycleFilterSerializer):
+    """
+    Filters of the coupon list. `valid_from` and `valid_to` select coupons valid at some point of the window.
+    """
+    category = serializers.IntegerField()
+    ctype = serializers.IntegerField()
+    interests = serializers.ListField(child=serializers.IntegerField())
+    organization = serializers.IntegerField()
+    active = serializers.BooleanField()
+    published = serializers.BooleanField()
+    # Active, published and running right now
+    live = serializers.BooleanField()
+    valid_from = serializers.DateTimeField()
+    valid_to = serializers.DateTimeField()
+
+
+class NearbyQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(min_value=1, max_value=settings.NEARBY_MAX_RADIUS,
+                                    default=settings.NEARBY_DEFAULT_RADIUS)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.API_MAX_PAGE_SIZE, default=20)
+
+
+class FeedQuerySerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=settings.API_MAX_PAGE_SIZE, default=20)
+    offset = serializers.IntegerField(min_value=0, default=0)
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.SYNC_MAX_LIMIT,
+                                     default=settings.SYNC_DEFAULT_LIMIT)
+
+
+class RateSerializer(serializers.ModelSerializer):
+    rate = serializers.IntegerField(min_value=1, max_value=5)
+
+    class Meta:
+        model = Rate
+        fields = ["id", "rate", "review"]
+
+
+class UseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Use
+        fields = ["id", "coupon", "code", "created"]
+
+
+class CodePoolSerializer(serializers.Serializer):
+    count = serializers.IntegerField(min_value=1, max_value=settings.CODE_POOL_MAX_REQUEST)
+
+
+class CampaignStatSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CampaignStat
+        fields = ["bucket", "views", "shortlists", "uses", "ratings", "rating_sum"]
+
+
+class StatsQuerySerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=StatCounters.GRANULARITIES, default=StatCounters.HOUR)
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, data: dict):
+        length = BUCKET_LENGTHS[data["granularity"]]
+        if "until" not in data:
+            data["until"] = timezone.now()
+        if "since" not in data:
+            data["since"] = data["until"] - length * 60
+        if data["since"] > data["until"]:
+            raise serializers.ValidationError("since must be before until")
+        if (data["until"] - data["since"]) / length > settings.STATS_MAX_BUCKETS:
+            raise serializers.ValidationError("Too many buckets, use coarser granularity or shorter period")
+        return data
+
+
 class RetriveUpdateUserSerializer(serializers.ModelSerializer):
     username = serializers.CharField(
         max_length=32,
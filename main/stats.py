@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from main.models import Coupon, Campaign, CouponEvent, CouponStat, CampaignStat, StatCounters, Watermark
+
+WATERMARK = "stats"
+
+# Key of the advisory lock event inserts hold in shared mode from drawing their id until they end,
+# see migration 0035
+EVENTS_LOCK_KEY = 480024
+
+PERIODS = [
+    (StatCounters.MINUTE, "minute"),
+    (StatCounters.HOUR, "hour"),
+    (StatCounters.DAY, "day"),
+]
+
+BUCKET_LENGTHS = {
+    StatCounters.MINUTE: timedelta(minutes=1),
+    StatCounters.HOUR: timedelta(hours=1),
+    StatCounters.DAY: timedelta(days=1),
+}
+
+# Adds counters of events (last, until] to the rollup table, creating missing buckets.
+# Events of deleted coupons and campaigns are skipped by the join.
+ROLLUP_SQL = """
+INSERT INTO {stats} ({key}, granularity, bucket, views, shortlists, uses, ratings, rating_sum)
+SELECT e.{key}, %(granularity)s, date_trunc(%(period)s, e.created),
+       COUNT(*) FILTER (WHERE e.kind = %(view)s),
+       COUNT(*) FILTER (WHERE e.kind = %(shortlist)s),
+       COUNT(*) FILTER (WHERE e.kind = %(use)s),
+       COUNT(*) FILTER (WHERE e.kind = %(rate)s),
+       COALESCE(SUM(e.value) FILTER (WHERE e.kind IN (%(rate)s, %(rerate)s)), 0)
+FROM {events} e JOIN {parent} p ON p.id = e.{key}
+WHERE e.id > %(last)s AND e.id <= %(until)s
+GROUP BY 1, 3
+ON CONFLICT ({key}, granularity, bucket) DO UPDATE SET
+    views = {stats}.views + EXCLUDED.views,
+    shortlists = {stats}.shortlists + EXCLUDED.shortlists,
+    uses = {stats}.uses + EXCLUDED.uses,
+    ratings = {stats}.ratings + EXCLUDED.ratings,
+    rating_sum = {stats}.rating_sum + EXCLUDED.rating_sum
+"""
+
+
+def roll_up_events(batch_size: int = None) -> int:
+    """
+    Folds the next batch of events into per-minute, per-hour and per-day counters of coupons and campaigns.
+    Returns the number of events processed.
+    """
+    batch_size = batch_size or settings.STATS_ROLLUP_BATCH_SIZE
+    # Waits for the transactions inserting events, every id drawn so far is then committed or rolled back
+    # and later ones are higher, so nothing can commit behind the watermark
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [EVENTS_LOCK_KEY])
+        settled = CouponEvent.objects.aggregate(last=Max('id'))['last'] or 0
+    with transaction.atomic():
+        Watermark.objects.get_or_create(name=WATERMARK)
+        watermark = Watermark.objects.select_for_update().get(name=WATERMARK)
+        ids = list(CouponEvent.objects.filter(id__gt=watermark.value, id__lte=settled).order_by('id')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        params = {
+            'last': watermark.value,
+            'until': ids[-1],
+            'view': CouponEvent.VIEW,
+            'shortlist': CouponEvent.SHORTLIST,
+            'use': CouponEvent.USE,
+            'rate': CouponEvent.RATE,
+            'rerate': CouponEvent.RERATE,
+        }
+        with connection.cursor() as cursor:
+            for stats, key, parent in [(CouponStat, 'coupon_id', Coupon), (CampaignStat, 'campaign_id', Campaign)]:
+                sql = ROLLUP_SQL.format(stats=stats._meta.db_table, key=key, parent=parent._meta.db_table,
+                                        events=CouponEvent._meta.db_table)
+                for granularity, period in PERIODS:
+                    cursor.execute(sql, dict(params, granularity=granularity, period=period))
+        watermark.value = ids[-1]
+        watermark.save(update_fields=['value'])
+    return len(ids)
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# <directory>/<first two digits>/<sha256>.<extension>
+BLOB_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+class BlobWriter:
+    """
+    A blob being written chunk by chunk, see ContentAddressedStorage.open_blob.
+    Either `commit` or `abort` has to be called once all chunks are written.
+    """
+
+    def __init__(self, storage, directory: str):
+        self.storage = storage
+        self.directory = directory
+        self.digest = hashlib.sha256()
+        full_directory = storage.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+        # Next to the final location, so the rename in commit stays on one filesystem
+        fd, self.temporary = tempfile.mkstemp(dir=full_directory, suffix='.part')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk: bytes):
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def commit(self, extension: str = '') -> str:
+        """Moves the blob to its final name and returns it."""
+        self.file.close()
+        hexdigest = self.digest.hexdigest()
+        name = os.path.join(self.directory, hexdigest[:2], hexdigest + extension.lower())
+        full_path = self.storage.path(name)
+        try:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if os.path.exists(full_path):
+                os.remove(self.temporary)
+                # A fresh mtime keeps `collect_blobs` off it until the new reference is committed
+                os.utime(full_path)
+            else:
+                if self.storage.file_permissions_mode is not None:
+                    os.chmod(self.temporary, self.storage.file_permissions_mode)
+                # Atomic, a parallel upload of the same content ends up with the same file
+                os.replace(self.temporary, full_path)
+        except BaseException:
+            self.abort()
+            raise
+        return name.replace('\\', '/')
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.temporary):
+            os.remove(self.temporary)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the SHA-256 of its content, so identical uploads share one blob.
+    The name passed in only contributes its directory and extension. Files are hashed while
+    they are copied to disk, and are never overwritten or deleted in place, which makes their
+    urls safe to cache forever. Blobs nothing refers to are removed by `collect_blobs`.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name depends on the content, an existing file with it is the same file
+        return name
+
+    def open_blob(self, directory: str) -> BlobWriter:
+        return BlobWriter(self, directory)
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        # Already written to this directory while it was uploaded, see main.uploads
+        blob = getattr(content, 'blob_name', None)
+        if blob and os.path.dirname(os.path.dirname(blob)) == directory:
+            return blob
+        writer = self.open_blob(directory)
+        try:
+            for chunk in content.chunks():
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit(os.path.splitext(filename)[1])
+
+    def blobs(self, directory: str = ''):
+        """
+        Yields the names of all content-addressed files under `directory`,
+        and of the temporary files left behind by interrupted saves.
+        """
+        for root, _, files in os.walk(self.path(directory)):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), self.location).replace('\\', '/')
+                if BLOB_NAME.search(name) or name.endswith('.part'):
+                    yield name
+
+
+coupon_storage = ContentAddressedStorage()
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Min
+
+from main.models import Coupon, CouponChange
+
+# Keeps only the latest change of every coupon in an id range, earlier ones are covered by it
+COMPACT_SQL = """
+DELETE FROM {changes} c
+WHERE c.id > %(after)s AND c.id <= %(until)s AND EXISTS (
+    SELECT 1 FROM {changes} l WHERE l.coupon_id = c.coupon_id AND l.id > c.id
+)
+"""
+
+
+def coupon_changes(since: int, limit: int) -> dict:
+    """
+    Published coupons changed after the `since` watermark and ids of those deleted or unpublished since,
+    at most `limit` changes at a time. Pass the returned watermark back to continue.
+    """
+    # Ids are handed out in commit order (see migration 0033), nothing can commit behind the watermark
+    changes = list(CouponChange.objects.filter(id__gt=since).order_by('id').values_list('id', 'coupon_id')[:limit])
+    changed = {coupon_id for _, coupon_id in changes}
+    coupons = list(Coupon.objects.filter(id__in=changed, published=True).order_by('id')
+                   .select_related('ctype', 'category').prefetch_related('interests', 'outlets'))
+    return {
+        "watermark": changes[-1][0] if changes else since,
+        "more": len(changes) == limit,
+        "coupons": coupons,
+        "tombstones": sorted(changed - {coupon.id for coupon in coupons}),
+    }
+
+
+def compact_changes(batch_size: int = None) -> int:
+    """
+    Deletes changes superseded by a later change of the same coupon, walking the log in id ranges
+    of `batch_size` that are each deleted in a statement of their own. Returns the number of rows removed.
+    """
+    batch_size = batch_size or settings.SYNC_COMPACT_BATCH_SIZE
+    bounds = CouponChange.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['last'] is None:
+        return 0
+    removed = 0
+    after = bounds['first'] - 1
+    with connection.cursor() as cursor:
+        while after < bounds['last']:
+            cursor.execute(COMPACT_SQL.format(changes=CouponChange._meta.db_table),
+                           {'after': after, 'until': after + batch_size})
+            removed += cursor.rowcount
+            after += batch_size
+    return removed
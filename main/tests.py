@@ -1,12 +1,27 @@
 import json
+import os
 import tempfile
-
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
 from django.core import mail
-from django.test import TestCase, Client, override_settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_jwt.utils import jwt_decode_handler
 
-from main.models import Vendor, Consumer, Organization, Campaign, Outlet, Coupon, Interest, Type, Category
+from main.models import Vendor, Consumer, Organization, Campaign, Outlet, Coupon, Interest, Type, Category, Email, \
+    Use, CouponChange, FeedCandidate, Rate
 
 MEDIA_ROOT = tempfile.mkdtemp()
 
@@ -195,8 +210,13 @@ class UserTestCase(StaticLiveServerTestCase):
             "email": "test@gmail.com"
         })
         self.assertEqual(response.status_code, 200)
+        # Delivered by the outbox worker, not within the request
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Email.objects.count(), 1)
+        call_command("send_emails", once=True)
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].to, ["test@gmail.com"])
+        self.assertEqual(Email.objects.count(), 0)
 
     def test_send_pin_to_vendor(self):
         self.client.post(self.path, {
@@ -206,11 +226,12 @@ class UserTestCase(StaticLiveServerTestCase):
             "atype": "V"
         })
         # Clear vendor verification email
-        mail.outbox.clear()
+        Email.objects.all().delete()
         response = self.client.post("/api/accounts/send-pin", {
             "email": "test@gmail.com"
         })
         self.assertEqual(response.status_code, 400)
+        call_command("send_emails", once=True)
         self.assertEqual(len(mail.outbox), 0)
 
     def test_verification_email(self):
@@ -220,6 +241,7 @@ class UserTestCase(StaticLiveServerTestCase):
             "password": "Vendor123",
             "atype": "V"
         })
+        call_command("send_emails", once=True)
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].to, ["vendor@gmail.com"])
         mail.outbox.clear()
@@ -231,9 +253,39 @@ class UserTestCase(StaticLiveServerTestCase):
         token = data["token"]
         response = self.client.get("/api/accounts/send-verification-email", HTTP_AUTHORIZATION="JWT {}".format(token))
         self.assertEqual(response.status_code, 200)
+        call_command("send_emails", once=True)
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].to, ["vendor@gmail.com"])
 
+    def test_email_retry(self):
+        self.client.post(self.path, {
+            "email": "test@gmail.com",
+            "atype": "C"
+        })
+        self.client.post("/api/accounts/send-pin", {
+            "email": "test@gmail.com"
+        })
+        with mock.patch("django.core.mail.EmailMultiAlternatives.send", side_effect=SMTPException("Server is down")):
+            call_command("send_emails", once=True)
+        email = Email.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, "Server is down")
+        # Not due yet
+        call_command("send_emails", once=True)
+        self.assertEqual(len(mail.outbox), 0)
+        Email.objects.update(next_attempt=email.created)
+        call_command("send_emails", once=True)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Email.objects.count(), 0)
+        # The last failed attempt drops the PIN
+        self.client.post("/api/accounts/send-pin", {
+            "email": "test@gmail.com"
+        })
+        Email.objects.update(attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS - 1)
+        with mock.patch("django.core.mail.EmailMultiAlternatives.send", side_effect=SMTPException("Server is down")):
+            call_command("send_emails", once=True)
+        self.assertDictEqual(Email.objects.get().context, {})
+
     def test_restriction(self):
         self.client.post(self.path, {
             "email": "vendor@gmail.com",
@@ -379,6 +431,8 @@ class TokenTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.content)
         token = data["token"]
+        payload = jwt_decode_handler(token)
+        self.assertTupleEqual((payload["atype"], payload["verified"], payload["restricted"]), ("V", False, False))
         response = self.client.get("/api/accounts/vendor", {}, HTTP_AUTHORIZATION="JWT {}".format(token))
         self.assertEqual(response.status_code, 200)
 
@@ -402,6 +456,32 @@ class TokenTestCase(TestCase):
         response = self.client.get("/api/accounts/vendor", HTTP_AUTHORIZATION="JWT {}".format(token))
         self.assertEqual(response.status_code, 200)
 
+    def test_cached_authentication(self):
+        response = self.client.post("/api/accounts/token/get", {
+            "email": "vendor@gmail.com",
+            "password": "Vendor123"
+        })
+        token = json.loads(response.content)["token"]
+        response = self.client.get("/api/accounts/consumer", HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 403)
+        # User and vendor profile are cached now
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/accounts/consumer", HTTP_AUTHORIZATION="JWT {}".format(token))
+            self.assertEqual(response.status_code, 403)
+            response = self.client.post("/api/organizations", {
+                "name": "McDonald's",
+                "address": "London, Baker street 221B"
+            }, HTTP_AUTHORIZATION="JWT {}".format(token))
+            self.assertEqual(response.status_code, 403)
+        # Saving the profile drops the cached user
+        self.vendor.vendor.verified = True
+        self.vendor.vendor.save()
+        response = self.client.post("/api/organizations", {
+            "name": "McDonald's",
+            "address": "London, Baker street 221B"
+        }, HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 201)
+
     def test_consumer_token(self):
         # Creating
         pin = self.consumer._set_new_pin()
@@ -954,6 +1034,24 @@ class CampaignTestCase(TestCase):
         self.assertEqual(response.status_code, 403)
         self.assertEqual(Campaign.objects.count(), 1)
 
+    def test_state_filter(self):
+        running = Campaign.objects.create(organization=self.organization, name="Running", active=True,
+                                          start="2001-11-15T19:15Z", end="2100-11-15T19:15Z")
+        paused = Campaign.objects.create(organization=self.organization, name="Paused", active=False,
+                                         start="2001-11-15T19:15Z", end="2100-11-15T19:15Z")
+        ended = Campaign.objects.create(organization=self.organization, name="Ended", active=True,
+                                        start="2001-11-15T19:15Z", end="2002-11-15T19:15Z")
+
+        def names(state):
+            response = self.client.get(self.path, {"state": state})
+            self.assertEqual(response.status_code, 200)
+            return {campaign["name"] for campaign in json.loads(response.content)["results"]}
+
+        self.assertSetEqual(names("active"), {running.name, ended.name})
+        self.assertSetEqual(names("inactive"), {paused.name})
+        self.assertSetEqual(names("used"), {ended.name})
+        self.assertEqual(self.client.get(self.path, {"state": "archived"}).status_code, 400)
+
 
 class TestOutlet(TestCase):
     def setUp(self):
@@ -999,9 +1097,72 @@ class TestOutlet(TestCase):
         self.assertEqual(response.status_code, 201)
         self.assertEqual(Outlet.objects.count(), 1)
         outlet = Outlet.objects.get()
+        self.assertTupleEqual((outlet.geom.x, outlet.geom.y), (-0.118092, 51.509865))
         response = self.client.get("{}/{}".format(self.path, outlet.id))
         self.assertEqual(response.status_code, 200)
 
+    def test_import(self):
+        path = "{}/import".format(self.path)
+        auth = "JWT {}".format(self.token)
+        csv_body = "external_id,name,description,address,latitude,longitude\n" \
+                   "S1,Baker street,Open 24/7,London,51.5237,-0.1585\n" \
+                   ",Soho,\"Burgers, fries\",London,51.5136,-0.1365\n" \
+                   "S3,Nowhere,Broken,Atlantis,91,0\n"
+
+        def post(body, content_type, **params):
+            query = "&".join("{}={}".format(key, value) for key, value in params.items())
+            return self.client.post("{}?organization={}&{}".format(path, self.organization.id, query), body,
+                                    content_type=content_type, HTTP_AUTHORIZATION=auth)
+
+        def counts(response):
+            data = json.loads(response.content)
+            return data["created"], data["updated"], data["skipped"], data["failed"]
+
+        # Organization not verified
+        self.assertEqual(post(csv_body, "text/csv").status_code, 400)
+        self.organization.verified = True
+        self.organization.save()
+        self.assertEqual(post(csv_body, "application/json").status_code, 415)
+
+        response = post(csv_body, "text/csv")
+        self.assertTupleEqual(counts(response), (2, 0, 0, 1))
+        data = json.loads(response.content)
+        self.assertEqual(data["errors"][0]["row"], 3)
+        self.assertIn("latitude", data["errors"][0]["errors"])
+        outlet = Outlet.objects.get(external_id="S1")
+        self.assertTupleEqual((outlet.geom.x, outlet.geom.y, outlet.owner_id), (-0.1585, 51.5237, self.vendor.id))
+        self.assertEqual(Outlet.objects.get(name="Soho").description, "Burgers, fries")
+
+        # Known store ids are skipped, or updated on request
+        ndjson_body = "\n".join(json.dumps(row) for row in [
+            {"external_id": "S1", "name": "Baker street 2", "description": "Moved", "address": "London",
+             "latitude": 51.52, "longitude": -0.15},
+            {"external_id": "S2", "name": "Camden", "description": "New", "address": "London",
+             "latitude": 51.539, "longitude": -0.1426},
+        ])
+        self.assertTupleEqual(counts(post(ndjson_body, "application/x-ndjson")), (1, 0, 1, 0))
+        self.assertEqual(Outlet.objects.get(external_id="S1").name, "Baker street")
+        self.assertTupleEqual(counts(post(ndjson_body, "application/x-ndjson", upsert="true")), (0, 2, 0, 0))
+        outlet = Outlet.objects.get(external_id="S1")
+        self.assertTupleEqual((outlet.name, outlet.geom.x, outlet.geom.y), ("Baker street 2", -0.15, 51.52))
+        self.assertEqual(Outlet.objects.count(), 3)
+        # Rows before an unreadable line are kept
+        response = post('{"external_id": "S4", "name": "Angel", "description": "New", "address": "London", '
+                        '"latitude": 51.53, "longitude": -0.1}\nnot json', "application/x-ndjson")
+        self.assertTupleEqual(counts(response), (1, 0, 0, 1))
+        self.assertEqual(json.loads(response.content)["errors"][0]["row"], 2)
+
+        # The command reads files the same way, a chunk at a time
+        with tempfile.NamedTemporaryFile(suffix=".csv") as f:
+            f.write(csv_body.replace("S1", "S5").replace(",Soho", "S6,Soho").encode())
+            f.flush()
+            out = StringIO()
+            call_command("import_outlets", f.name, organization=self.organization.id, chunk_size=1, stdout=out,
+                         stderr=StringIO())
+        self.assertIn("Created 2, updated 0, skipped 0, failed 1", out.getvalue())
+        self.assertEqual(Outlet.objects.count(), 6)
+        self.assertEqual(self.client.post(path, csv_body, content_type="text/csv").status_code, 401)
+
     def test_wrong_creating(self):
         # No credentials
         response = self.client.post(self.path, {
@@ -1405,6 +1566,244 @@ class TestCoupon(StaticLiveServerTestCase):
         response = self.client.get("{}/{}".format(self.path, coupon.id))
         self.assertEqual(response.status_code, 200)
 
+    def test_image_variants(self):
+        from PIL import Image
+
+        response = self.client.post(self.path, {
+            "ctype": self.ctype.id,
+            "category": self.category.id,
+            "campaign": self.campaign.id,
+            "outlets": [self.outlet.id],
+            "name": "Best Sale!",
+            "description": "Shop opening sale!",
+            "deal": "Every item just half price",
+            "image": self.image,
+            "TC": "TC",
+            "amount": 100,
+            "code": "TE189312F",
+            "start": "2001-11-15T10:00:00Z",
+            "end": "2100-11-15T10:00:00Z",
+            "interests": [self.interest.id]
+        }, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 201)
+        path = "{}/{}".format(self.path, json.loads(response.content)["id"])
+        # Rendered off the request path
+        self.assertDictEqual(json.loads(self.client.get(path).content)["image_variants"], {})
+        call_command("render_images", once=True)
+        variants = json.loads(self.client.get(path).content)["image_variants"]
+        self.assertSetEqual(set(variants), {"thumbnail", "small", "medium"})
+        self.assertSetEqual(set(variants["thumbnail"]), {"webp", "jpeg"})
+        coupon = Coupon.objects.get()
+        thumbnail = coupon.variants["sizes"]["thumbnail"]
+        with Image.open(os.path.join(MEDIA_ROOT, thumbnail["webp"])) as image:
+            self.assertTupleEqual((image.format, image.size), ("WEBP", (160, 160)))
+        # Never upscaled
+        with Image.open(os.path.join(MEDIA_ROOT, coupon.variants["sizes"]["medium"]["jpeg"])) as image:
+            self.assertTupleEqual(image.size, (200, 200))
+        # A new image replaces the variants, the old files stay until they are collected
+        with tempfile.NamedTemporaryFile(suffix='.png') as f:
+            Image.new('RGB', (300, 100), 'red').save(f, 'PNG')
+            f.seek(0)
+            response = self.client.post(path, {"image": f}, HTTP_AUTHORIZATION="JWT {}".format(self.token),
+                                        HTTP_X_HTTP_METHOD_OVERRIDE="PATCH")
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(json.loads(self.client.get(path).content)["image_variants"], {})
+        call_command("render_images", once=True)
+        self.assertNotEqual(json.loads(self.client.get(path).content)["image_variants"], {})
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, thumbnail["webp"])))
+        call_command("collect_blobs", once=True, grace=0)
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, thumbnail["webp"])))
+        coupon.refresh_from_db()
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, coupon.image.name)))
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, coupon.variants["sizes"]["thumbnail"]["webp"])))
+        # Whatever breaks rendering, the coupon gets no sizes instead of stopping the worker
+        Coupon.objects.update(variants={})
+        with mock.patch("main.images.ImageOps.exif_transpose", side_effect=Image.DecompressionBombError):
+            call_command("render_images", once=True)
+        coupon.refresh_from_db()
+        self.assertDictEqual(coupon.variants, {"source": coupon.image.name, "sizes": {}})
+
+    def test_upload_limits(self):
+        from PIL import Image
+
+        def create(image):
+            return self.client.post(self.path, {
+                "ctype": self.ctype.id,
+                "category": self.category.id,
+                "campaign": self.campaign.id,
+                "outlets": [self.outlet.id],
+                "name": "Best Sale!",
+                "description": "Shop opening sale!",
+                "deal": "Every item just half price",
+                "image": image,
+                "TC": "TC",
+                "amount": 100,
+                "code": "TE189312F",
+                "start": "2001-11-15T10:00:00Z",
+                "end": "2100-11-15T10:00:00Z",
+                "interests": [self.interest.id]
+            }, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+
+        def partial_files():
+            return [name for _, _, files in os.walk(MEDIA_ROOT) for name in files if name.endswith(".part")]
+
+        with tempfile.NamedTemporaryFile(suffix=".png") as f:
+            f.write(b"Not an image at all")
+            f.seek(0)
+            response = create(f)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("image", json.loads(response.content))
+        with override_settings(COUPON_IMAGE_MAX_DIMENSION=100):
+            response = create(self._create_image())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("100x100", json.loads(response.content)["image"][0])
+        # Noise does not compress, the file is bigger than the limit
+        with tempfile.NamedTemporaryFile(suffix=".png") as f:
+            Image.frombytes("L", (400, 400), os.urandom(400 * 400)).save(f, "PNG")
+            f.seek(0)
+            with override_settings(COUPON_IMAGE_MAX_SIZE=100000):
+                response = create(f)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("100000 bytes", json.loads(response.content)["image"][0])
+        self.assertEqual(Coupon.objects.count(), 0)
+        self.assertListEqual(partial_files(), [])
+        # Anonymous users are told to authenticate first
+        with tempfile.NamedTemporaryFile(suffix=".png") as f:
+            f.write(b"Not an image at all")
+            f.seek(0)
+            self.assertEqual(self.client.post(self.path, {"image": f}).status_code, 401)
+        # Images of users who can't create coupons are not stored at all
+        storage = Coupon._meta.get_field("image").storage
+        blobs = list(storage.blobs("coupons"))
+        self.assertEqual(self.client.post(self.path, {"image": self._create_image()}).status_code, 401)
+        self.assertEqual(self.client.post(self.path, {"image": self._create_image()},
+                                          HTTP_AUTHORIZATION="JWT {}".format(self._consumer_token())).status_code, 403)
+        self.assertListEqual(list(storage.blobs("coupons")), blobs)
+        self.assertEqual(create(self._create_image()).status_code, 201)
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, Coupon.objects.get().image.name)))
+
+    def test_bulk(self):
+        path = "{}/bulk".format(self.path)
+        auth = "JWT {}".format(self.token)
+        image = Coupon._meta.get_field("image").storage.save("coupons/images/banner.png", self._create_image())
+
+        def item(i, **kwargs):
+            data = {
+                "ctype": self.ctype.id,
+                "category": self.category.id,
+                "campaign": self.campaign.id,
+                "outlets": [self.outlet.id],
+                "name": "Bulk sale #{}".format(i),
+                "description": "Shop opening sale!",
+                "deal": "Every item just half price",
+                "image": "http://testserver/media/{}".format(image),
+                "TC": "TC",
+                "amount": 100,
+                "code": "TE189312F",
+                "start": "2001-11-15T10:00:00Z",
+                "end": "2100-11-15T10:00:00Z",
+                "published": True,
+                "interests": [self.interest.id]
+            }
+            data.update(kwargs)
+            return data
+
+        def post(items):
+            return self.client.post(path, json.dumps(items), content_type="application/json", HTTP_AUTHORIZATION=auth)
+
+        self.assertListEqual(json.loads(post([]).content), [])
+        # Checked and written with the same number of queries whatever the batch size
+        with CaptureQueriesContext(connection) as small:
+            response = post([item(i) for i in range(2)])
+        self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as large:
+            response = post([item(i) for i in range(2, 12)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small), len(large))
+        ids = [row["id"] for row in json.loads(response.content)]
+        self.assertEqual(Coupon.objects.count(), 12)
+        coupon = Coupon.objects.get(pk=ids[0])
+        self.assertTupleEqual((coupon.name, coupon.image.name, coupon.owner_id, coupon.live),
+                              ("Bulk sale #2", image, self.vendor.id, True))
+        self.assertListEqual(list(coupon.outlets.values_list("id", flat=True)), [self.outlet.id])
+        # Search vectors are built too
+        response = self.client.get(self.path, {"q": "bulk", "page_size": 20})
+        self.assertEqual(len(json.loads(response.content)["results"]), 12)
+
+        # Updates change only the given fields
+        response = post([{"id": ids[0], "name": "Renamed", "interests": []}, {"id": ids[1], "published": False}])
+        self.assertEqual(response.status_code, 200)
+        first, second = Coupon.objects.get(pk=ids[0]), Coupon.objects.get(pk=ids[1])
+        self.assertTupleEqual((first.name, first.published, first.interests.count()), ("Renamed", True, 0))
+        self.assertTupleEqual((second.name, second.published, second.live), ("Bulk sale #3", False, False))
+        # The campaign a coupon leaves no longer lists it
+        other = Campaign.objects.create(organization=self.organization, name="Winter campaign",
+                                        start=timezone.now(), end=timezone.now() + timedelta(days=30))
+        left = Campaign.objects.get(pk=self.campaign.pk).updated_at
+        self.assertEqual(post([{"id": ids[0], "campaign": other.id}]).status_code, 200)
+        self.assertGreater(Campaign.objects.get(pk=self.campaign.pk).updated_at, left)
+
+        # One bad item keeps the whole batch out, errors are reported per item
+        response = post([item(20), item(21, ctype=9999, campaign=9999), item(22, image="coupons/images/sale.png"),
+                         {"id": 9999, "name": "Missing"}])
+        self.assertEqual(response.status_code, 400)
+        errors = json.loads(response.content)
+        self.assertDictEqual(errors[0], {})
+        self.assertSetEqual(set(errors[1]), {"ctype", "campaign"})
+        self.assertSetEqual(set(errors[2]), {"image"})
+        self.assertSetEqual(set(errors[3]), {"id"})
+        self.assertEqual(Coupon.objects.count(), 12)
+
+        # Newline delimited JSON works the same
+        body = "\n".join(json.dumps(item(i)) for i in range(30, 33))
+        response = self.client.post(path, body, content_type="application/x-ndjson", HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Coupon.objects.count(), 15)
+        response = self.client.post(path, "{}\nnot json", content_type="application/x-ndjson",
+                                    HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(post({"name": "Not a list"}).status_code, 400)
+        # Referencing an image keeps it from the blob collector until the batch is committed
+        blob = Coupon._meta.get_field("image").storage.path(image)
+        os.utime(blob, (0, 0))
+        self.assertEqual(post([item(40)]).status_code, 200)
+        self.assertGreater(os.path.getmtime(blob), time.time() - 60)
+
+    def test_image_dedup(self):
+        for _ in range(2):
+            response = self.client.post(self.path, {
+                "ctype": self.ctype.id,
+                "category": self.category.id,
+                "campaign": self.campaign.id,
+                "outlets": [self.outlet.id],
+                "name": "Best Sale!",
+                "description": "Shop opening sale!",
+                "deal": "Every item just half price",
+                "image": self._create_image(),
+                "TC": "TC",
+                "amount": 100,
+                "code": "TE189312F",
+                "start": "2001-11-15T10:00:00Z",
+                "end": "2100-11-15T10:00:00Z",
+                "interests": [self.interest.id]
+            }, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+            self.assertEqual(response.status_code, 201)
+        # The same upload is stored once, under the hash of its content
+        first, second = Coupon.objects.order_by("id")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^coupons/images/[0-9a-f]{2}/[0-9a-f]{64}\.png$")
+        call_command("render_images", once=True)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertDictEqual(first.variants, second.variants)
+        # Blobs live as long as one coupon refers to them
+        first.delete()
+        call_command("collect_blobs", once=True, grace=0)
+        self.assertTrue(os.path.exists(os.path.join(MEDIA_ROOT, second.image.name)))
+        second.delete()
+        call_command("collect_blobs", once=True, grace=0)
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, second.image.name)))
+
     def test_wrong_creating(self):
         # No auth
         response = self.client.post(self.path, {
@@ -1789,8 +2188,606 @@ class TestCoupon(StaticLiveServerTestCase):
                                       HTTP_AUTHORIZATION="JWT {}".format(token))
         self.assertEqual(response.status_code, 403)
 
+    def _create_coupons(self, count, **kwargs):
+        for i in range(count):
+            fields = dict(ctype=self.ctype, category=self.category, campaign=self.campaign,
+                          name="Sale #{}".format(i), description="Shop opening sale!",
+                          deal="Every item just half price", image="coupons/images/sale.png",
+                          TC="TC", amount=100, code="TE189312F",
+                          start="2001-11-15T10:00:00Z", end="2100-11-15T10:00:00Z")
+            fields.update(kwargs)
+            coupon = Coupon.objects.create(**fields)
+            coupon.interests.add(self.interest)
+            coupon.outlets.add(self.outlet)
+
+    def test_listing_query_count(self):
+        self._create_coupons(3)
+        # Coupons (with type and category joined), interests, outlets and facets, which also give the validators
+        with self.assertNumQueries(4):
+            response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self._create_coupons(10)
+        with self.assertNumQueries(4):
+            response = self.client.get(self.path, {"page_size": 5})
+        self.assertEqual(response.status_code, 200)
+        # Later pages have no facets and their validators come from the page itself
+        next_page = json.loads(response.content)["next"]
+        response = self.client.get(next_page)
+        with self.assertNumQueries(3):
+            response = self.client.get(next_page, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        coupon = Coupon.objects.first()
+        # Plus the view event
+        with self.assertNumQueries(5):
+            response = self.client.get("{}/{}".format(self.path, coupon.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_listing_pagination(self):
+        self._create_coupons(5)
+        response = self.client.get(self.path, {"page_size": 2})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(len(data["results"]), 2)
+        self.assertIsNone(data["previous"])
+        seen = [coupon["id"] for coupon in data["results"]]
+        while data["next"]:
+            data = json.loads(self.client.get(data["next"]).content)
+            seen += [coupon["id"] for coupon in data["results"]]
+        self.assertListEqual(seen, list(Coupon.objects.order_by("start", "id").values_list("id", flat=True)))
+        # And back, the coupons all share their start
+        back = [coupon["id"] for coupon in data["results"]]
+        while data["previous"]:
+            data = json.loads(self.client.get(data["previous"]).content)
+            back = [coupon["id"] for coupon in data["results"]] + back
+        self.assertListEqual(back, seen)
+        # Cursor with a position of the wrong shape
+        self.assertEqual(self.client.get(self.path, {"cursor": "cD1ub3Bl"}).status_code, 404)
+
+    def test_conditional_get(self):
+        self._create_coupons(2)
+        coupon = Coupon.objects.first()
+        path = "{}/{}".format(self.path, coupon.id)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        # Answered by the validators lookup alone, no view event
+        with self.assertNumQueries(1):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        coupon.name = "Renamed"
+        coupon.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(self.client.get("{}/0".format(self.path), HTTP_IF_NONE_MATCH="*").status_code, 404)
+        # Redemptions take stock without touching the coupon
+        etag = self.client.get(path)["ETag"]
+        Coupon.objects.filter(pk=coupon.pk).update(amount=0)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Coupons nest their category, type and interests
+        etag = self.client.get(path)["ETag"]
+        self.category.name = "Closing"
+        self.category.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["category"]["name"], "Closing")
+
+        response = self.client.get(self.path)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get(self.path, {"page_size": 1}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Coupon.objects.last().delete()
+        self.assertEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Parents list their children, so they change with them
+        path = "/api/campaigns/{}".format(self.campaign.id)
+        etag = self.client.get(path)["ETag"]
+        self._create_coupons(1)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        path = "/api/outlets/{}".format(self.outlet.id)
+        etag = self.client.get(path)["ETag"]
+        coupon.outlets.remove(self.outlet)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_facets(self):
+        food = Interest.objects.create(name="Food", description="Restaurants")
+        other = Category.objects.create(name="Closing", description="Last chance")
+        self._create_coupons(3, active=True)
+        self._create_coupons(2, active=False, category=other)
+        Coupon.objects.filter(category=other).first().interests.add(food)
+        response = self.client.get(self.path)
+        facets = json.loads(response.content)["facets"]
+        self.assertListEqual(facets["category"], [{"id": self.category.id, "count": 3}, {"id": other.id, "count": 2}])
+        self.assertListEqual(facets["ctype"], [{"id": self.ctype.id, "count": 5}])
+        self.assertListEqual(facets["interests"], [{"id": self.interest.id, "count": 5}, {"id": food.id, "count": 1}])
+
+        response = self.client.get(self.path, {"category": other.id})
+        data = json.loads(response.content)
+        self.assertEqual(len(data["results"]), 2)
+        self.assertListEqual(data["facets"]["category"], [{"id": other.id, "count": 2}])
+        response = self.client.get(self.path, {"interests": [food.id, self.interest.id]})
+        self.assertEqual(len(json.loads(response.content)["results"]), 5)
+        response = self.client.get(self.path, {"interests": food.id, "active": "false"})
+        data = json.loads(response.content)
+        self.assertEqual(len(data["results"]), 1)
+        self.assertListEqual(data["facets"]["interests"], [{"id": self.interest.id, "count": 1},
+                                                           {"id": food.id, "count": 1}])
+        self.assertEqual(len(json.loads(self.client.get(self.path, {"active": "true"}).content)["results"]), 3)
+        response = self.client.get(self.path, {"organization": self.organization.id + 1})
+        data = json.loads(response.content)
+        self.assertListEqual(data["results"], [])
+        self.assertListEqual(data["facets"]["ctype"], [])
+        # Coupons run from 2001 to 2100
+        response = self.client.get(self.path, {"valid_from": "2000-01-01T00:00:00Z", "valid_to": "2000-12-31T00:00Z"})
+        self.assertListEqual(json.loads(response.content)["results"], [])
+        response = self.client.get(self.path, {"valid_from": "2050-01-01T00:00:00Z"})
+        self.assertEqual(len(json.loads(response.content)["results"]), 5)
+        self.assertEqual(self.client.get(self.path, {"category": "abc"}).status_code, 400)
+        # Later pages come without facets
+        data = json.loads(self.client.get(self.path, {"page_size": 2}).content)
+        self.assertNotIn("facets", json.loads(self.client.get(data["next"]).content))
+
+    def test_state_filter(self):
+        self._create_coupons(2, active=True)
+        self._create_coupons(1, active=False)
+        self._create_coupons(1, active=True, end="2002-11-15T10:00:00Z")
+
+        def count(state):
+            response = self.client.get(self.path, {"state": state})
+            self.assertEqual(response.status_code, 200)
+            return len(json.loads(response.content)["results"])
+
+        self.assertEqual(count("active"), 3)
+        self.assertEqual(count("inactive"), 1)
+        self.assertEqual(count("used"), 1)
+        self.assertEqual(self.client.get(self.path, {"state": "archived"}).status_code, 400)
+
+    def test_lifecycle_sweep(self):
+        self._create_coupons(3, published=True)
+        running, expiring, scheduled = Coupon.objects.order_by("id")
+        campaign = Campaign.objects.create(organization=self.organization, name="Flash sale", active=True,
+                                           start=timezone.now() - timedelta(days=1),
+                                           end=timezone.now() + timedelta(days=1))
+        # Ending now and starting right after by the clock of the writing transaction, so the flags
+        # are right when written and stale for any later one
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT now()")
+            now = cursor.fetchone()[0]
+            Coupon.objects.filter(pk=expiring.pk).update(end=now)
+            Coupon.objects.filter(pk=scheduled.pk).update(start=now + timedelta(microseconds=1))
+            Campaign.objects.filter(pk=campaign.pk).update(end=now)
+        self.assertListEqual(list(Coupon.objects.order_by("id").values_list("live", flat=True)), [True, True, False])
+        self.assertTrue(Campaign.objects.get(pk=campaign.pk).live)
+        # Writes keep the flag in line at once
+        Coupon.objects.filter(pk=running.pk).update(published=False)
+        self.assertFalse(Coupon.objects.get(pk=running.pk).live)
+        Coupon.objects.filter(pk=running.pk).update(published=True)
+
+        call_command("sweep_lifecycle", once=True)
+        self.assertListEqual(list(Coupon.objects.order_by("id").values_list("live", flat=True)), [True, False, True])
+        self.assertFalse(Campaign.objects.get(pk=campaign.pk).live)
+        response = self.client.get(self.path, {"live": "true"})
+        self.assertListEqual([coupon["id"] for coupon in json.loads(response.content)["results"]],
+                             [running.id, scheduled.id])
+
+    def test_consumer_feed(self):
+        path = "/api/accounts/consumer/feed"
+        food = Interest.objects.create(name="Food", description="Restaurants")
+        self._create_coupons(3, published=True)
+        self._create_coupons(1, published=False)
+        both, single, unrelated, draft = Coupon.objects.order_by("id")
+        both.interests.add(food)
+        unrelated.interests.clear()
+        draft.interests.add(food)
+        auth = "JWT {}".format(self._consumer_token())
+        self.assertListEqual(json.loads(self.client.get(path, HTTP_AUTHORIZATION=auth).content), [])
+
+        response = self.client.patch("/api/accounts/consumer", json.dumps({"interests": [self.interest.id, food.id]}),
+                                     content_type="application/json", HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response.status_code, 200)
+        # Candidates are built in the background
+        self.assertListEqual(json.loads(self.client.get(path, HTTP_AUTHORIZATION=auth).content), [])
+        call_command("refresh_feeds", once=True)
+        # Shared interests first, drafts are never shown. Ids, coupons, interests and outlets
+        with self.assertNumQueries(4):
+            response = self.client.get(path, HTTP_AUTHORIZATION=auth)
+        self.assertListEqual([coupon["id"] for coupon in json.loads(response.content)], [both.id, single.id])
+        # Coupons joining an interest get into the feed
+        unrelated.interests.add(food, self.interest)
+        call_command("refresh_feeds", once=True)
+        data = json.loads(self.client.get(path, {"limit": 2}, HTTP_AUTHORIZATION=auth).content)
+        self.assertListEqual([coupon["id"] for coupon in data], [both.id, unrelated.id])
+        # Good ratings lift a coupon among equals, once the feed is rebuilt
+        other = get_user_model().objects.create_user(username="other", email="other@gmail.com",
+                                                     password="other12345", atype="C")
+        Rate.objects.create(consumer=other.consumer, coupon=unrelated, rate=5)
+        # Rating again replaces the consumer's rating
+        for rate in (3, 5):
+            self.client.post("{}/{}/rate".format(self.path, unrelated.id), {"rate": rate}, HTTP_AUTHORIZATION=auth)
+        unrelated.refresh_from_db()
+        self.assertEqual((unrelated.ratings, unrelated.rating_sum), (2, 10))
+        stale = timezone.now() - timedelta(seconds=settings.FEED_REFRESH_AGE + 1)
+        Consumer.objects.update(feed_refreshed=stale)
+        call_command("refresh_feeds", once=True)
+        data = json.loads(self.client.get(path, HTTP_AUTHORIZATION=auth).content)
+        self.assertListEqual([coupon["id"] for coupon in data], [unrelated.id, both.id, single.id])
+        # Feeds keep their best coupons only
+        with override_settings(FEED_SIZE=2):
+            Consumer.objects.update(feed_refreshed=stale)
+            call_command("refresh_feeds", once=True)
+            self.assertEqual(FeedCandidate.objects.count(), 2)
+            # A new coupon doing worse than the last of a full feed stays out of it
+            self._create_coupons(1, published=True)
+            call_command("refresh_feeds", once=True)
+            self.assertEqual(FeedCandidate.objects.count(), 2)
+            # The last coupon of a full feed stays in it when it is merged again after an edit
+            last = FeedCandidate.objects.order_by("score").values_list("coupon_id", flat=True).first()
+            FeedCandidate.queue_coupons([last])
+            call_command("refresh_feeds", once=True)
+            self.assertIn(last, FeedCandidate.objects.values_list("coupon_id", flat=True))
+        # Dropping an interest drops what only matched it
+        self.client.patch("/api/accounts/consumer", json.dumps({"interests": [food.id]}),
+                          content_type="application/json", HTTP_AUTHORIZATION=auth)
+        call_command("refresh_feeds", once=True)
+        data = json.loads(self.client.get(path, HTTP_AUTHORIZATION=auth).content)
+        self.assertListEqual([coupon["id"] for coupon in data], [unrelated.id, both.id])
+        self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION="JWT {}".format(self.token)).status_code, 403)
+
+    @override_settings(ALERT_FANOUT_DELAY=0)
+    def test_hot_offer_alerts(self):
+        consumers = {"consumer@gmail.com": self.consumer.consumer}
+        for email in ("near@gmail.com", "far@gmail.com", "muted@gmail.com"):
+            user = get_user_model().objects.create(email=email, username=email, atype="C")
+            consumers[email] = user.consumer
+        # London and Paris, the outlet is in London
+        Consumer.objects.filter(pk=consumers["near@gmail.com"].pk).update(latitude=51.5, longitude=-0.1,
+                                                                          alert_radius=10000)
+        Consumer.objects.filter(pk=consumers["far@gmail.com"].pk).update(latitude=48.85, longitude=2.35,
+                                                                         alert_radius=10000)
+        Consumer.objects.filter(pk=consumers["muted@gmail.com"].pk).update(alerts=False)
+        for consumer in consumers.values():
+            consumer.interests.add(self.interest)
+        self._create_coupons(1, published=True)
+        self._create_coupons(1, published=False)
+        Email.objects.all().delete()
+
+        def alerts():
+            call_command("fan_out_alerts", once=True)
+            emails = list(Email.objects.filter(template="main/email/hot-offer"))
+            Email.objects.all().delete()
+            return emails
+
+        emails = alerts()
+        self.assertSetEqual({email.to for email in emails}, {"consumer@gmail.com", "near@gmail.com"})
+        self.assertIn("Sale #0", emails[0].to_message().body)
+        # Every coupon is announced once, drafts once published
+        self.assertListEqual(alerts(), [])
+        Coupon.objects.filter(published=False).update(published=True)
+        self.assertEqual(len(alerts()), 2)
+        self.assertListEqual(alerts(), [])
+
+    def test_search(self):
+        self._create_coupons(2)
+        food = Interest.objects.create(name="Food", description="Restaurants")
+        fields = dict(ctype=self.ctype, category=self.category, campaign=self.campaign, image="coupons/images/sale.png",
+                      TC="TC", amount=100, code="TE189312F", start="2001-11-15T10:00:00Z",
+                      end="2100-11-15T10:00:00Z")
+        pizza = Coupon.objects.create(name="Pizza", description="Two for one", deal="Any size", **fields)
+        pizza.interests.add(food)
+        lunch = Coupon.objects.create(name="Lunch deal", description="Pizza and a salad", deal="Noon only", **fields)
+
+        def search(q):
+            response = self.client.get(self.path, {"q": q})
+            self.assertEqual(response.status_code, 200)
+            return [coupon["id"] for coupon in json.loads(response.content)["results"]]
+
+        # Name matches rank above description matches
+        self.assertListEqual(search("pizza"), [pizza.id, lunch.id])
+        # Typos fall back to trigram similarity of the name
+        self.assertListEqual(search("piza"), [pizza.id])
+        self.assertListEqual(search("food"), [pizza.id])
+        self.assertEqual(len(search("McDonald's")), 4)
+        self.assertListEqual(search("sushi"), [])
+        # The search document follows renames of related rows
+        food.name = "Groceries"
+        food.save()
+        self.assertListEqual(search("groceries"), [pizza.id])
+        self.assertListEqual(search("food"), [])
+        pizza.interests.clear()
+        self.assertListEqual(search("groceries"), [])
+        self.organization.name = "Burger King"
+        self.organization.save()
+        self.assertEqual(len(search("burger")), 4)
+        # Ranked results page like any other list
+        response = self.client.get(self.path, {"q": "pizza", "page_size": 1})
+        data = json.loads(response.content)
+        self.assertListEqual([coupon["id"] for coupon in data["results"]], [pizza.id])
+        data = json.loads(self.client.get(data["next"]).content)
+        self.assertListEqual([coupon["id"] for coupon in data["results"]], [lunch.id])
+
+    def test_sync(self):
+        path = "/api/sync/coupons"
+        self._create_coupons(3, published=True)
+        self._create_coupons(1, published=False)
+        published = list(Coupon.objects.filter(published=True).order_by("id"))
+        draft = Coupon.objects.get(published=False)
+        data = json.loads(self.client.get(path).content)
+        self.assertListEqual([coupon["id"] for coupon in data["coupons"]], [coupon.id for coupon in published])
+        self.assertListEqual(data["tombstones"], [draft.id])
+        self.assertFalse(data["more"])
+        watermark = data["watermark"]
+        data = json.loads(self.client.get(path, {"since": watermark}).content)
+        self.assertEqual(data, {"watermark": watermark, "more": False, "coupons": [], "tombstones": []})
+
+        published[0].name = "Renamed"
+        published[0].save()
+        Coupon.objects.filter(pk=published[1].pk).update(published=False)
+        published[2].delete()
+        # Counters and stock don't produce changes
+        Coupon.objects.filter(pk=published[0].pk).update(codes_left=10, amount=0)
+        data = json.loads(self.client.get(path, {"since": watermark}).content)
+        self.assertListEqual([coupon["name"] for coupon in data["coupons"]], ["Renamed"])
+        self.assertListEqual(data["tombstones"], sorted([published[1].id, published[2].id]))
+
+        data = json.loads(self.client.get(path, {"limit": 1}).content)
+        self.assertTrue(data["more"])
+        self.assertEqual(self.client.get(path, {"since": -1}).status_code, 400)
+
+        call_command("compact_changes", once=True)
+        self.assertEqual(CouponChange.objects.count(), 4)
+        data = json.loads(self.client.get(path).content)
+        self.assertListEqual([coupon["id"] for coupon in data["coupons"]], [published[0].id])
+        self.assertListEqual(data["tombstones"], sorted([draft.id, published[1].id, published[2].id]))
+
+    def test_vendor_dashboard(self):
+        path = "/api/accounts/vendor"
+        auth = "JWT {}".format(self.token)
+        self._create_coupons(3)
+        self.client.get(path, HTTP_AUTHORIZATION=auth)
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(path, HTTP_AUTHORIZATION=auth)
+        self.assertEqual(len(json.loads(response.content)["coupons"]), 3)
+        self._create_coupons(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(path, HTTP_AUTHORIZATION=auth)
+        data = json.loads(response.content)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(data["coupons"]), 13)
+        self.assertEqual(len(data["campaigns"][0]["coupons"]), 13)
+        self.assertEqual(len(data["outlets"][0]["coupons"]), 13)
+
+        response = self.client.get(path, {"include": "campaigns"}, HTTP_AUTHORIZATION=auth)
+        data = json.loads(response.content)
+        self.assertIn("organization", data)
+        self.assertIn("campaigns", data)
+        self.assertNotIn("coupons", data)
+        self.assertNotIn("outlets", data)
+
+        response = self.client.get(path, {"coupons_page_size": 5}, HTTP_AUTHORIZATION=auth)
+        data = json.loads(response.content)
+        seen = [coupon["id"] for coupon in data["coupons"]]
+        self.assertEqual(len(seen), 5)
+        self.assertIsNone(data["coupons_previous"])
+        self.assertNotIn("outlets_next", data)
+        self.assertEqual(len(data["outlets"]), 1)
+        while data["coupons_next"]:
+            data = json.loads(self.client.get(data["coupons_next"], HTTP_AUTHORIZATION=auth).content)
+            seen += [coupon["id"] for coupon in data["coupons"]]
+        self.assertListEqual(seen, list(Coupon.objects.order_by("start", "id").values_list("id", flat=True)))
+
+    def test_owner_denormalization(self):
+        self._create_coupons(2)
+        self.assertEqual(Campaign.objects.get().owner_id, self.vendor.id)
+        self.assertEqual(Outlet.objects.get().owner_id, self.vendor.id)
+        self.assertSetEqual(set(Coupon.objects.values_list("owner_id", flat=True)), {self.vendor.id})
+        # Organization is handed to another vendor
+        user = get_user_model().objects.create_user(username="test", email="test@gmail.com",
+                                                    password="test12345", atype="V")
+        self.organization.vendor = user.vendor
+        self.organization.save()
+        self.assertEqual(Campaign.objects.get().owner_id, user.id)
+        self.assertEqual(Outlet.objects.get().owner_id, user.id)
+        self.assertSetEqual(set(Coupon.objects.values_list("owner_id", flat=True)), {user.id})
+        coupon = Coupon.objects.first()
+        response = self.client.delete("{}/{}".format(self.path, coupon.id),
+                                      HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 403)
+
+    def _consumer_token(self):
+        response = self.client.post("/api/accounts/token/get", {
+            "email": "consumer@gmail.com",
+            "password": self.consumer._set_new_pin()
+        })
+        return json.loads(response.content)["token"]
+
+    def test_campaign_stats(self):
+        self._create_coupons(2)
+        first, second = Coupon.objects.order_by("id")
+        token = self._consumer_token()
+        self.client.get("{}/{}".format(self.path, first.id))
+        self.client.get("{}/{}".format(self.path, first.id), HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.client.get("{}/{}".format(self.path, second.id))
+        response = self.client.post("{}/{}/shortlist".format(self.path, first.id),
+                                    HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post("{}/{}/rate".format(self.path, second.id), {"rate": 4},
+                                    HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post("{}/{}/rate".format(self.path, second.id), {"rate": 6},
+                                    HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 400)
+        # Rating again replaces the rating
+        response = self.client.post("{}/{}/rate".format(self.path, second.id), {"rate": 2},
+                                    HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 200)
+        second.refresh_from_db()
+        self.assertEqual((second.ratings, second.rating_sum), (1, 2))
+        # Vendors can't rate
+        response = self.client.post("{}/{}/rate".format(self.path, second.id), {"rate": 4},
+                                    HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 403)
+
+        call_command("rollup_stats", once=True)
+        path = "/api/campaigns/{}/stats".format(self.campaign.id)
+        for granularity in ["m", "h", "d"]:
+            response = self.client.get(path, {"granularity": granularity},
+                                       HTTP_AUTHORIZATION="JWT {}".format(self.token))
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            self.assertDictEqual(data["totals"], {"views": 3, "shortlists": 1, "uses": 0, "ratings": 1,
+                                                  "rating_sum": 2})
+        self.assertDictEqual(
+            first.stats.filter(granularity="d").values("views", "shortlists", "ratings").get(),
+            {"views": 2, "shortlists": 1, "ratings": 0}
+        )
+        # Rolling up again doesn't count events twice
+        call_command("rollup_stats", once=True)
+        response = self.client.get(path, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(json.loads(response.content)["totals"]["views"], 3)
+
+        # Only the owner can see statistics
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(path, HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(path, {"granularity": "m", "since": "2001-11-15T10:00:00Z"},
+                                   HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 400)
+
+    def test_use_stats(self):
+        self._create_coupons(1, published=True, amount=1)
+        coupon = Coupon.objects.get()
+        token = self._consumer_token()
+        path = "{}/{}/use".format(self.path, coupon.id)
+        response = self.client.post(path, HTTP_AUTHORIZATION="JWT {}".format(token), HTTP_IDEMPOTENCY_KEY="first")
+        self.assertEqual(response.status_code, 201)
+        # A retry is not another use
+        response = self.client.post(path, HTTP_AUTHORIZATION="JWT {}".format(token), HTTP_IDEMPOTENCY_KEY="first")
+        self.assertEqual(response.status_code, 200)
+
+        call_command("rollup_stats", once=True)
+        response = self.client.get("/api/campaigns/{}/stats".format(self.campaign.id),
+                                   HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["totals"]["uses"], 1)
+
+    def test_coupon_use(self):
+        self._create_coupons(1, published=True, amount=1)
+        coupon = Coupon.objects.get()
+        token = self._consumer_token()
+        path = "{}/{}/use".format(self.path, coupon.id)
+        response = self.client.post(path, HTTP_AUTHORIZATION="JWT {}".format(token), HTTP_IDEMPOTENCY_KEY="first")
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.content)
+        self.assertEqual(data["code"], "TE189312F")
+        # Retry returns the same redemption
+        response = self.client.post(path, HTTP_AUTHORIZATION="JWT {}".format(token), HTTP_IDEMPOTENCY_KEY="first")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["id"], data["id"])
+        response = self.client.post(path, HTTP_AUTHORIZATION="JWT {}".format(token), HTTP_IDEMPOTENCY_KEY="second")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Coupon.objects.get().amount, 0)
+        self.assertEqual(Use.objects.count(), 1)
+        # Not published
+        self._create_coupons(1, amount=10)
+        coupon = Coupon.objects.get(published=False)
+        # A key already spent on another coupon
+        response = self.client.post("{}/{}/use".format(self.path, coupon.id), HTTP_AUTHORIZATION="JWT {}".format(token),
+                                    HTTP_IDEMPOTENCY_KEY="first")
+        self.assertEqual(response.status_code, 422)
+        response = self.client.post("{}/{}/use".format(self.path, coupon.id), HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 409)
+        # Vendors can't use coupons
+        response = self.client.post("{}/{}/use".format(self.path, coupon.id),
+                                    HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 403)
+
+    def test_coupon_use_concurrency(self):
+        self._create_coupons(1, published=True, amount=5)
+        coupon = Coupon.objects.get()
+        token = self._consumer_token()
+        path = "{}/{}/use".format(self.path, coupon.id)
+        codes = []
+
+        def redeem(key):
+            try:
+                response = Client().post(path, HTTP_AUTHORIZATION="JWT {}".format(token),
+                                         HTTP_IDEMPOTENCY_KEY=key)
+                codes.append(response.status_code)
+            finally:
+                connection.close()
+
+        # Every key is sent twice to mix retries into the load
+        threads = [threading.Thread(target=redeem, args=("key-{}".format(i // 2),)) for i in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Coupon.objects.get().amount, 0)
+        self.assertEqual(Use.objects.filter(coupon=coupon).count(), 5)
+        # Five keys won, both of their requests got the redemption
+        self.assertTupleEqual((codes.count(201), codes.count(200), codes.count(409)), (5, 5, 30))
+
+    @override_settings(CODE_POOL_BATCH_SIZE=3)
+    def test_code_pool(self):
+        self._create_coupons(1, published=True, amount=100)
+        coupon = Coupon.objects.get()
+        path = "{}/{}/codes".format(self.path, coupon.id)
+        response = self.client.post(path, {"count": 7}, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(json.loads(response.content), {"unique_codes": True, "remaining": 7})
+        self.assertEqual(coupon.codes.count(), 7)
+        response = self.client.post(path, {"count": 0}, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 400)
+        # Vendor edits don't overwrite the counter
+        coupon.name = "Renamed"
+        coupon.save()
+
+        token = self._consumer_token()
+        codes = set()
+        for i in range(8):
+            response = self.client.post("{}/{}/use".format(self.path, coupon.id),
+                                        HTTP_AUTHORIZATION="JWT {}".format(token))
+            if response.status_code == 201:
+                codes.add(json.loads(response.content)["code"])
+        self.assertEqual(len(codes), 7)
+        self.assertSetEqual(codes, set(coupon.codes.values_list("code", flat=True)))
+        self.assertEqual(response.status_code, 409)
+        response = self.client.get(path, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(json.loads(response.content)["remaining"], 0)
+        self.assertEqual(Coupon.objects.get().amount, 93)
+        # Only the owner manages codes
+        response = self.client.get(path, HTTP_AUTHORIZATION="JWT {}".format(token))
+        self.assertEqual(response.status_code, 403)
+
+    def test_nearby(self):
+        self._create_coupons(2, published=True)
+        self._create_coupons(1, published=False)
+        # Trafalgar Square, about a kilometre away from the outlet
+        response = self.client.get("{}/nearby".format(self.path), {"lat": 51.508039, "lon": -0.128069,
+                                                                   "radius": 2000})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(len(data), 2)
+        self.assertTrue(all(500 < coupon["distance"] < 1000 for coupon in data))
+        response = self.client.get("{}/nearby".format(self.path), {"lat": 51.508039, "lon": -0.128069,
+                                                                   "radius": 2000, "limit": 1})
+        self.assertEqual(len(json.loads(response.content)), 1)
+        # Boston
+        response = self.client.get("{}/nearby".format(self.path), {"lat": 42.361145, "lon": -71.057083})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 0)
+        # Wrong data
+        response = self.client.get("{}/nearby".format(self.path), {"lat": 91, "lon": -0.128069})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("{}/nearby".format(self.path), {"lon": -0.128069})
+        self.assertEqual(response.status_code, 400)
+
 
-class TestAdminFunctionality(TestCase):
+class TestAdminFunctionality(TransactionTestCase):
     def setUp(self):
         self.client = Client()
         self.client.post("/api/accounts/create", {
@@ -1861,6 +2858,36 @@ class TestAdminFunctionality(TestCase):
         self.organization = Organization.objects.get()
         self.assertFalse(self.organization.verified)
 
+    def test_reference_cache(self):
+        caches['default'].clear()
+        response = self.client.post("/api/categories", {
+            "name": "Opening",
+            "description": "Coupons in new shops"
+        }, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get("/api/categories")
+        self.assertEqual(len(json.loads(response.content)), 1)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/categories")
+        self.assertEqual(response["ETag"], etag)
+        response = self.client.get("/api/categories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        # Writes bump the version
+        response = self.client.post("/api/categories", {
+            "name": "Closing",
+            "description": "Last chance"
+        }, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get("/api/categories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 2)
+        self.assertNotEqual(response["ETag"], etag)
+        Category.objects.get(name="Closing").delete()
+        response = self.client.get("/api/categories")
+        self.assertEqual(response["ETag"], etag)
+
     def test_restrict_user(self):
         response = self.client.post("/api/admin/restrict", {
             "id": self.vendor.id,
@@ -1869,6 +2896,13 @@ class TestAdminFunctionality(TestCase):
         self.assertEqual(response.status_code, 200)
         self.vendor = get_user_model().objects.get(atype="V")
         self.assertTrue(self.vendor.vendor.restricted)
+        response = self.client.post("/api/campaigns", {
+            "organization": self.organization.id,
+            "name": "Summer campaign",
+            "start": "2001-11-15T19:15",
+            "end": "2019-11-15T19:15"
+        }, HTTP_AUTHORIZATION="JWT {}".format(self.token))
+        self.assertEqual(response.status_code, 403)
         response = self.client.post("/api/admin/restrict", {
             "id": self.vendor.id,
             "state": False
@@ -0,0 +1,119 @@
+import os
+from io import BytesIO
+
+from PIL import Image
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework.exceptions import ValidationError
+
+from main.models import Coupon
+
+# Bytes buffered to find the image header in, JPEG headers may follow up to 64KB of EXIF
+HEADER_LIMIT = 256 * 1024
+# Pillow format -> stored file extension
+FORMATS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'GIF': '.gif',
+    'WEBP': '.webp',
+}
+INVALID_IMAGE = "Upload a valid image. The file you uploaded was either not an image or a corrupted image."
+
+
+class StreamedImage(UploadedFile):
+    """An upload StreamingImageUploadHandler already checked and wrote to its final blob."""
+
+    def __init__(self, storage, blob_name: str, name: str, content_type: str, size: int, charset: str,
+                 image_format: str, dimensions: tuple):
+        self.storage = storage
+        self.blob_name = blob_name
+        self.image_format = image_format
+        self.dimensions = dimensions
+        super(StreamedImage, self).__init__(open(storage.path(blob_name), 'rb'), name, content_type, size, charset)
+
+    def temporary_file_path(self):
+        return self.storage.path(self.blob_name)
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """
+    Writes uploaded coupon images straight into their content-addressed blob, hashing them on the way.
+    The header is identified from the first chunks, so files that are not images, too large in bytes
+    or in pixels are rejected before the rest of the body is read. Memory stays at one chunk and
+    the header buffer whatever the size of the upload. Rejections raise a ValidationError of the field.
+    """
+
+    def __init__(self, request=None):
+        super(StreamingImageUploadHandler, self).__init__(request)
+        field = Coupon._meta.get_field('image')
+        self.storage = field.storage
+        self.directory = os.path.dirname(field.generate_filename(None, 'image'))
+        self.writer = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        form_limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if form_limit is not None and content_length > settings.COUPON_IMAGE_MAX_SIZE + form_limit:
+            # Bigger than any accepted image and form fields together, don't read a byte of it
+            raise ValidationError({'image': [self._too_large()]})
+
+    def new_file(self, *args, **kwargs):
+        super(StreamingImageUploadHandler, self).new_file(*args, **kwargs)
+        self.writer = self.storage.open_blob(self.directory)
+        self.size = 0
+        self.header = b''
+        self.image_format = None
+        self.dimensions = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.COUPON_IMAGE_MAX_SIZE:
+            self._reject(self._too_large())
+        self.writer.write(raw_data)
+        if self.image_format is None:
+            self.header += raw_data
+            self._identify(final=False)
+
+    def file_complete(self, file_size):
+        if self.image_format is None:
+            self._identify(final=True)
+        blob_name = self.writer.commit(FORMATS[self.image_format])
+        self.writer = None
+        return StreamedImage(self.storage, blob_name, self.file_name, self.content_type, file_size, self.charset,
+                             self.image_format, self.dimensions)
+
+    def upload_interrupted(self):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+
+    def _identify(self, final: bool):
+        try:
+            # Lazy, only the header is parsed and no pixels are allocated
+            with Image.open(BytesIO(self.header)) as image:
+                image_format, dimensions = image.format, image.size
+        except Image.DecompressionBombError:
+            self._reject(self._too_many_pixels())
+        except Exception:
+            # Most likely a header cut short, wait for more of it
+            if final or len(self.header) >= HEADER_LIMIT:
+                self._reject(INVALID_IMAGE)
+            return
+        if image_format not in FORMATS:
+            self._reject(INVALID_IMAGE)
+        if max(dimensions) > settings.COUPON_IMAGE_MAX_DIMENSION:
+            self._reject(self._too_many_pixels())
+        self.image_format, self.dimensions = image_format, dimensions
+        self.header = None
+
+    def _reject(self, message: str):
+        self.upload_interrupted()
+        raise ValidationError({self.field_name: [message]})
+
+    @staticmethod
+    def _too_large() -> str:
+        return "Image must not be larger than {} bytes".format(settings.COUPON_IMAGE_MAX_SIZE)
+
+    @staticmethod
+    def _too_many_pixels() -> str:
+        return "Image must not be larger than {0}x{0} pixels".format(settings.COUPON_IMAGE_MAX_DIMENSION)
@@ -5,7 +5,8 @@ from rest_framework_jwt.views import ObtainJSONWebToken, RefreshJSONWebToken, Ve
 from main.serializers import CustomJWTSerializer
 from main.views import send_pin, verify_email, ConsumerProfile, OrganizationViewSet, create_user, \
     CampaignViewSet, OutletViewSet, CouponViewSet, VendorProfile, CategoryListView, TypeListView, InterestListView, \
-    UserInfoView, resend_verification_email, grant_admin, verify_organization, restrict
+    UserInfoView, resend_verification_email, grant_admin, verify_organization, restrict, CouponSync, \
+    ConsumerFeed
 
 router = DefaultRouter(trailing_slash=False)
 router.register(r'organizations', OrganizationViewSet, base_name='organization')
@@ -28,6 +29,7 @@ accounts = [
     path("send-pin", send_pin),
     path("send-verification-email", resend_verification_email),
     path("consumer", ConsumerProfile.as_view()),
+    path("consumer/feed", ConsumerFeed.as_view()),
     path("vendor", VendorProfile.as_view()),
     path("token/", include(token))
 ]
@@ -36,10 +38,14 @@ admin = [
     path("grant", grant_admin),
     path("verify", verify_organization)
 ]
+sync = [
+    path("coupons", CouponSync.as_view()),
+]
 api = [
     path("", include(router.urls)),
     path("accounts/", include(accounts)),
-    path("admin/", include(admin))
+    path("admin/", include(admin)),
+    path("sync/", include(sync))
 ]
 urlpatterns = [
     path("api/", include(api)),
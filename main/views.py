@@ -1,20 +1,46 @@
+import hashlib
+from calendar import timegm
+from io import BytesIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.db import IntegrityError
+from django.db.models import Min, Prefetch
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_etags, http_date
 from rest_framework import status, viewsets, exceptions, generics
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, SAFE_METHODS
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from simple_email_confirmation.exceptions import EmailConfirmationExpired
 
-from main.models import Organization, Campaign, Outlet, Coupon, Category, Type, Interest
+from main.bulk import BulkCouponWriter, import_outlets
+from main.cache import cached_reference
+from main.facets import coupon_facets
+from main.feed import consumer_feed
+from main.geo import KNNDistance, radius_to_degrees
+from main.models import Organization, Campaign, Outlet, Coupon, Category, Type, Interest, CouponEvent, ShortList, \
+    Use, Rate
+from main.pagination import CouponCursorPagination, CampaignCursorPagination, IdCursorPagination
+from main.parsers import NDJSONParser
 from main.permissions import IsVendor, IsConsumer, IsAdminUserOrReadOnly, IsOwnerOrReadOnly, \
-    IsEmailVerifiedOrReadOnly, IsAdmin, IsNotRestricted
+    IsEmailVerifiedOrReadOnly, IsAdmin, IsNotRestricted, IsOwner
 from main.serializers import UserSerializer, ConsumerSerializer, OrganizationSerializer, CampaignSerializer, \
     OutletSerializer, CouponSerializer, VendorSerializer, CategorySerializer, TypeSerializer, InterestSerializer, \
-    RetrieveCouponSerializer, RetriveUpdateUserSerializer, VendorStateSerializer, OrganizationStateSerializer
+    RetrieveCouponSerializer, RetriveUpdateUserSerializer, VendorStateSerializer, OrganizationStateSerializer, \
+    NearbyCouponSerializer, NearbyQuerySerializer, RateSerializer, CampaignStatSerializer, StatsQuerySerializer, \
+    UseSerializer, CodePoolSerializer, SyncQuerySerializer, CouponFilterSerializer, LifecycleFilterSerializer, \
+    FeedQuerySerializer, OutletImportQuerySerializer
+from main.search import search_coupons
+from main.sync import coupon_changes
+from main.uploads import StreamingImageUploadHandler
 
 
 @api_view(['POST'])
@@ -75,19 +101,64 @@ class ConsumerProfile(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ConsumerFeed(APIView):
+    permission_classes = [IsAuthenticated, IsConsumer]
+
+    def get(self, request: Request):
+        query = FeedQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        coupons = consumer_feed(request.user.consumer, query.validated_data["limit"], query.validated_data["offset"])
+        serializer = RetrieveCouponSerializer(coupons, many=True, context={"request": request})
+        return Response(serializer.data)
+
+
 class VendorProfile(APIView):
     permission_classes = [IsAuthenticated, IsVendor]
 
+    def get_sections(self):
+        """
+        Dashboard sections: queryset, serializer and pagination used when the section is paged.
+        Every section is fetched with a fixed number of queries whatever the number of rows.
+        """
+        user = self.request.user
+        return {
+            "coupons": (
+                Coupon.objects.filter(owner=user).prefetch_related('interests', 'outlets').order_by('start', 'id'),
+                CouponSerializer, CouponCursorPagination
+            ),
+            "campaigns": (
+                Campaign.objects.filter(owner=user).order_by('start', 'id')
+                    .prefetch_related(Prefetch('coupons', queryset=Coupon.objects.only('id', 'campaign_id'))),
+                CampaignSerializer, CampaignCursorPagination
+            ),
+            "outlets": (
+                Outlet.objects.filter(owner=user).order_by('id')
+                    .prefetch_related(Prefetch('coupons', queryset=Coupon.objects.only('id'))),
+                OutletSerializer, IdCursorPagination
+            ),
+        }
+
     def get(self, request: Request):
         profile = request.user.vendor
         serializer = VendorSerializer(profile)
         response = serializer.data
-        response["coupons"] = [CouponSerializer(coupon).data for coupon in
-                               Coupon.objects.filter(campaign__organization__vendor=profile)]
-        response["campaigns"] = [CampaignSerializer(campaign).data for campaign in
-                                 Campaign.objects.filter(organization__vendor=profile)]
-        response["outlets"] = [OutletSerializer(outlet).data for outlet in
-                                Outlet.objects.filter(organization__vendor=profile)]
+        sections = self.get_sections()
+        include = request.query_params.get("include")
+        include = include.split(",") if include else sections.keys()
+        for section, (queryset, serializer_class, pagination_class) in sections.items():
+            if section not in include:
+                continue
+            # Sections are paged only on request, e.g. ?coupons_page_size=20, then ?coupons_cursor=...
+            cursor_param, page_size_param = "{}_cursor".format(section), "{}_page_size".format(section)
+            if cursor_param in request.query_params or page_size_param in request.query_params:
+                paginator = pagination_class()
+                paginator.cursor_query_param = cursor_param
+                paginator.page_size_query_param = page_size_param
+                queryset = paginator.paginate_queryset(queryset, request, view=self)
+                response["{}_next".format(section)] = paginator.get_next_link()
+                response["{}_previous".format(section)] = paginator.get_previous_link()
+            response[section] = serializer_class(queryset, many=True).data
         return Response(response)
 
     def patch(self, request: Request):
@@ -124,54 +195,387 @@ class MethodSerializerView(object):
         raise exceptions.MethodNotAllowed(self.request.method)
 
 
-class OrganizationViewSet(viewsets.ModelViewSet):
+class ConditionalGetMixin(object):
+    """
+    Answers If-None-Match / If-Modified-Since on list and retrieve from the `updated_at` of the rows
+    being served, before anything is serialized. Lists only look at their page, so deep pages stay cheap.
+    """
+    # Served fields that change without touching updated_at, made part of the row keys
+    validator_fields = ()
+
+    def get_validator_key(self, pk, *values) -> str:
+        return "-".join(str(value) for value in (pk,) + values)
+
+    def get_validators(self, rows):
+        """
+        Returns (etag, last_modified) of (key, updated_at) pairs, or (None, None) if there are none.
+        The keys are part of the ETag so rows leaving the response change it too.
+        """
+        if not rows:
+            return None, None
+        updated_at = max(row_updated_at for _, row_updated_at in rows)
+        state = " ".join("{}@{}".format(key, row_updated_at.isoformat()) for key, row_updated_at in rows)
+        digest = hashlib.sha1("{} {}".format(self.request.get_full_path(), state).encode())
+        return '"{}"'.format(digest.hexdigest()), timegm(updated_at.utctimetuple())
+
+    def conditional(self, rows, render):
+        etag, last_modified = self.get_validators(rows)
+        response = None
+        if etag is not None:
+            response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render()
+        if etag is not None and response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_list_validator_rows(self, queryset, page) -> list:
+        """The (key, updated_at) pairs a list response depends on, the rows of its page."""
+        return [(self.get_validator_key(row.pk, *(getattr(row, name) for name in self.validator_fields)),
+                 row.updated_at) for row in page]
+
+    def list(self, request: Request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+
+        def render():
+            data = self.get_serializer(rows, many=True).data
+            return Response(data) if page is None else self.get_paginated_response(data)
+
+        return self.conditional(self.get_list_validator_rows(queryset, rows), render)
+
+    def retrieve(self, request: Request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError):
+            # get_object() turns it into a 404
+            queryset = queryset.none()
+
+        def render():
+            instance = self.get_object()
+            self.perform_retrieve(instance)
+            return Response(self.get_serializer(instance).data)
+
+        rows = queryset.values_list('pk', *self.validator_fields, 'updated_at')
+        return self.conditional([(self.get_validator_key(*row[:-1]), row[-1]) for row in rows], render)
+
+    def perform_retrieve(self, instance):
+        pass
+
+
+class OrganizationViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = OrganizationSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly, IsEmailVerifiedOrReadOnly, IsNotRestricted]
-    queryset = Organization.objects.all()
+    queryset = Organization.objects.select_related('vendor')
 
 
-class CampaignViewSet(viewsets.ModelViewSet):
+class CampaignViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = CampaignSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly, IsNotRestricted]
+    pagination_class = CampaignCursorPagination
     queryset = Campaign.objects.all()
 
-
-class OutletViewSet(viewsets.ModelViewSet):
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        query = LifecycleFilterSerializer(data=self.request.query_params, partial=True)
+        query.is_valid(raise_exception=True)
+        if "state" in query.validated_data:
+            queryset = queryset.filter(query.get_state_filter())
+        return queryset
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated, IsOwner])
+    def stats(self, request: Request, pk=None):
+        campaign = self.get_object()
+        query = StatsQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        # Served from rollups only, raw events are never read here
+        series = campaign.stats.filter(granularity=params["granularity"], bucket__gte=params["since"],
+                                       bucket__lte=params["until"]).order_by('bucket')
+        data = CampaignStatSerializer(series, many=True).data
+        totals = {field: sum(row[field] for row in data) for field in CampaignStatSerializer.Meta.fields[1:]}
+        return Response({
+            "granularity": params["granularity"],
+            "since": params["since"],
+            "until": params["until"],
+            "totals": totals,
+            "series": data,
+        })
+
+
+class OutletViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = OutletSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly, IsNotRestricted]
     queryset = Outlet.objects.all()
 
+    # Content type -> import format
+    import_formats = {
+        "text/csv": "csv",
+        "application/x-ndjson": "ndjson",
+    }
 
-class CouponViewSet(MethodSerializerView, viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'], url_path='import',
+            permission_classes=[IsAuthenticated, IsVendor, IsNotRestricted])
+    def import_outlets(self, request: Request):
+        """Streams the body into import_outlets, it is never parsed as a whole."""
+        import_format = self.import_formats.get(request.content_type.split(";")[0].strip())
+        if import_format is None:
+            raise exceptions.UnsupportedMediaType(request.content_type)
+        query = OutletImportQuerySerializer(data=request.query_params, context={"request": request})
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        result = import_outlets(request.stream or BytesIO(), import_format, query.validated_data["organization"],
+                                query.validated_data["upsert"])
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class CouponViewSet(ConditionalGetMixin, MethodSerializerView, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly, IsNotRestricted]
     parser_classes = (MultiPartParser, FormParser)
-    queryset = Coupon.objects.all()
+    pagination_class = CouponCursorPagination
+    queryset = Coupon.objects.select_related('ctype', 'category').prefetch_related('interests', 'outlets')
     method_serializer_classes = {
         ('GET',): RetrieveCouponSerializer,
         ('POST', 'PATCH'): CouponSerializer,
     }
+    # Redemptions take stock without touching the coupon
+    validator_fields = ('amount',)
+
+    # Actions taking an image, None is a POST to a coupon its form turns into a PATCH
+    image_actions = ('create', 'update', 'partial_update', None)
 
     def initialize_request(self, request, *args, **kwargs):
         request = super().initialize_request(request, *args, **kwargs)
-        request.method = request.META.get("HTTP_X_HTTP_METHOD_OVERRIDE", request.POST.get("_method", request.method)).upper()
+        # The form's _method is read in initial, the body must not be parsed before the user is known
+        request.method = request.META.get("HTTP_X_HTTP_METHOD_OVERRIDE", request.method).upper()
+        self.action = self.action_map.get(request.method.lower())
         return request
 
+    def initial(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            # Parsing stores uploaded images for good, so only users allowed to write get that far
+            self.perform_authentication(request)
+            self.check_permissions(request)
+            if self.action in self.image_actions:
+                request._request.upload_handlers = [StreamingImageUploadHandler(request._request)]
+            if "HTTP_X_HTTP_METHOD_OVERRIDE" not in request.META:
+                request.method = request.POST.get("_method", request.method).upper()
+                self.action = self.action_map.get(request.method.lower())
+        super().initial(request, *args, **kwargs)
+
+    # CouponFilterSerializer field -> lookup
+    filter_lookups = {
+        "category": "category_id",
+        "ctype": "ctype_id",
+        "organization": "campaign__organization_id",
+        "active": "active",
+        "published": "published",
+        "live": "live",
+        "valid_from": "end__gte",
+        "valid_to": "start__lte",
+    }
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        query = CouponFilterSerializer(data=self.request.query_params, partial=True)
+        query.is_valid(raise_exception=True)
+        filters = query.validated_data
+        queryset = queryset.filter(**{lookup: filters[name] for name, lookup in self.filter_lookups.items()
+                                      if name in filters})
+        if "state" in filters:
+            queryset = queryset.filter(query.get_state_filter())
+        if filters.get("interests"):
+            # A semi-join, so coupons with several of the interests are not repeated
+            queryset = queryset.filter(id__in=Coupon.interests.through.objects
+                                       .filter(interest_id__in=filters["interests"]).values('coupon_id'))
+        q = self.request.query_params.get("q", "").strip()
+        if q:
+            queryset = search_coupons(queryset, q)
+            # Best matches first
+            self.paginator.ordering = ('-rank', 'id')
+        return queryset
+
+    def get_list_validator_rows(self, queryset, page) -> list:
+        rows = super().get_list_validator_rows(queryset, page)
+        if self.paginator.cursor_query_param not in self.request.query_params:
+            # The first page carries the facets, which change with any coupon of the list.
+            # Their scan also counts the list, kept for the response if it is rendered.
+            self.facets, count, updated_at = coupon_facets(queryset)
+            if count:
+                rows.append(("facets {}".format(count), updated_at))
+        return rows
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        # Facets describe the whole filtered list, so they come with its first page only
+        if self.paginator.cursor_query_param not in self.request.query_params:
+            response.data["facets"] = self.facets
+        return response
+
+    def perform_retrieve(self, coupon):
+        # A 304 is a client re-checking a coupon it already has, only full reads count as views
+        consumer = getattr(self.request.user, "consumer", None)
+        CouponEvent.record(coupon, CouponEvent.VIEW, consumer.id if consumer else None)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsConsumer])
+    def shortlist(self, request: Request, pk=None):
+        ShortList.objects.get_or_create(consumer=request.user.consumer, coupon=self.get_object())
+        return Response("OK", status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsVendor, IsNotRestricted],
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request: Request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"non_field_errors": ["Expected a list of coupons"]}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.COUPON_BULK_MAX_ITEMS:
+            return Response({"non_field_errors": ["At most {} coupons at once".format(settings.COUPON_BULK_MAX_ITEMS)]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        writer = BulkCouponWriter(items, request.user)
+        if not writer.is_valid():
+            return Response(writer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response([{"id": coupon_id} for coupon_id in writer.save()], status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsConsumer])
+    def rate(self, request: Request, pk=None):
+        coupon = self.get_object()
+        serializer = RateSerializer(data=request.data)
+        if serializer.is_valid():
+            # Rating again replaces the consumer's rating
+            rate, created = Rate.objects.update_or_create(consumer=request.user.consumer, coupon=coupon,
+                                                          defaults=serializer.validated_data)
+            return Response(RateSerializer(rate).data,
+                            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated, IsConsumer])
+    def use(self, request: Request, pk=None):
+        coupon = self.get_object()
+        consumer = request.user.consumer
+        key = request.META.get("HTTP_IDEMPOTENCY_KEY") or None
+        if key is not None:
+            if len(key) > Use._meta.get_field('idempotency_key').max_length:
+                return Response("Idempotency-Key is too long", status=status.HTTP_400_BAD_REQUEST)
+            replay = self._replay_use(coupon, consumer, key)
+            if replay is not None:
+                return replay
+        try:
+            use = coupon.redeem(consumer, key)
+        except IntegrityError:
+            # Parallel retry with the same key got there first, its decrement is the only one
+            use = None
+        if use is None and key is not None:
+            # A parallel retry that committed while this one waited for the stock left it empty
+            replay = self._replay_use(coupon, consumer, key)
+            if replay is not None:
+                return replay
+        if use is None:
+            message = "Coupon is out of stock" if coupon.is_available() else "Coupon is not available"
+            return Response(message, status=status.HTTP_409_CONFLICT)
+        return Response(UseSerializer(use).data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def _replay_use(coupon, consumer, key: str):
+        """
+        Response to a retry of the consumer's redemption with Idempotency-Key `key`, None if there is none yet.
+        """
+        use = Use.objects.filter(consumer=consumer, idempotency_key=key).first()
+        if use is None:
+            return None
+        if use.coupon_id != coupon.id:
+            return Response("Idempotency-Key was used for another coupon", status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(UseSerializer(use).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get', 'post'], permission_classes=[IsAuthenticated, IsOwner, IsNotRestricted])
+    def codes(self, request: Request, pk=None):
+        coupon = self.get_object()
+        if request.method == "POST":
+            data = CodePoolSerializer(data=request.data)
+            if not data.is_valid():
+                return Response(data.errors, status=status.HTTP_400_BAD_REQUEST)
+            coupon.generate_codes(data.validated_data["count"])
+        # Maintained counter, the pool is never counted
+        return Response({"unique_codes": coupon.unique_codes, "remaining": coupon.codes_left})
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request: Request):
+        query = NearbyQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        lat, lon, radius = query.validated_data["lat"], query.validated_data["lon"], query.validated_data["radius"]
+        point = Point(lon, lat, srid=4326)
+        # Nearest outlets first: bounding box and KNN ordering both run on the geom GiST index,
+        # the exact spherical distance is only computed for the rows inside the box.
+        outlets = Outlet.objects.filter(geom__dwithin=(point, radius_to_degrees(radius, lat)),
+                                        geom__distance_lte=(point, D(m=radius))) \
+                      .order_by(KNNDistance('geom', point)).values('id')[:settings.NEARBY_MAX_OUTLETS]
+        coupons = self.get_queryset().filter(live=True, outlets__in=outlets) \
+                      .annotate(distance=Min(Distance('outlets__geom', point))) \
+                      .order_by('distance', 'id')[:query.validated_data["limit"]]
+        serializer = NearbyCouponSerializer(coupons, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+
+class CouponSync(APIView):
+    """
+    Delta feed of published coupons for offline clients. Start with since=0, then keep passing
+    the returned watermark; `more` tells whether another call would return further changes.
+    """
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request: Request):
+        query = SyncQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        changes = coupon_changes(query.validated_data["since"], query.validated_data["limit"])
+        changes["coupons"] = RetrieveCouponSerializer(changes["coupons"], many=True,
+                                                      context={"request": request}).data
+        return Response(changes)
+
+
+class CachedReferenceMixin:
+    """
+    Serves the list from the versioned reference cache with a strong ETag,
+    answering 304 when the client already holds the current version.
+    """
+
+    def list(self, request, *args, **kwargs):
+        # In a stable order, the ETag is a digest of the list
+        entry = cached_reference(self.queryset.model._meta.model_name,
+                                 lambda: list(self.get_serializer(self.get_queryset().order_by('pk'), many=True).data))
+        etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if entry["etag"] in etags or "*" in etags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": entry["etag"]})
+        return Response(entry["data"], headers={"ETag": entry["etag"]})
+
 
-class CategoryListView(viewsets.ModelViewSet):
+class CategoryListView(CachedReferenceMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [IsAdminUserOrReadOnly]
+    pagination_class = None
     queryset = Category.objects.all()
 
 
-class TypeListView(viewsets.ModelViewSet):
+class TypeListView(CachedReferenceMixin, viewsets.ModelViewSet):
     serializer_class = TypeSerializer
     permission_classes = [IsAdminUserOrReadOnly]
+    pagination_class = None
     queryset = Type.objects.all()
 
 
-class InterestListView(viewsets.ModelViewSet):
+class InterestListView(CachedReferenceMixin, viewsets.ModelViewSet):
     serializer_class = InterestSerializer
     permission_classes = [IsAdminUserOrReadOnly]
+    pagination_class = None
     queryset = Interest.objects.all()
 
 